@@ -0,0 +1,390 @@
+"""Benchmark report for the SoccerBetFactory contract.
+
+Runs benchmark.py with the SmartPy CLI, then measures every call of the generated
+traffic (see bench_traffic.py):
+
+- storage size before and after the call, and the paid storage it triggers
+  (bytes above the high-water mark of the scenario, at 250 mutez per byte),
+- the size of the parameter and an estimate of the forged operation size,
+- the gas consumed, by replaying the call with `octez-client --mode mockup run script`.
+  The big_maps of the storage are passed by id with --extra-big-maps, as they are on
+  chain, so that the gas does not include parsing every element of every big_map.
+  The SmartPy interpreter does not account for gas, so gas is reported as null when
+  octez-client is not available. Entry points taking a list (receive_results) also
+  report the gas per item, i.e. per resolved game.
+
+Sizes are binary Micheline sizes when octez-client is available and sizes of the
+whitespace-compacted Michelson text otherwise; the report records which one was used.
+
+The probe scenarios make the same bet, unbet and redeem calls on one game next to a
+varying number of open games (bench_traffic.PROBE_GRID). Their gas and storage must not
+depend on that number: any difference is listed under flat_cost and fails the run. The
+check needs the gas, so the run also fails when octez-client is not available, as the
+storage sizes alone would not show a cost growing with the number of games.
+
+Everything runs offline. The report is written as JSON and compared to a baseline:
+
+    python bench_report.py --smartpy ~/smartpy-cli/SmartPy.sh
+    python bench_report.py --save-baseline
+"""
+
+import argparse
+import functools
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import bench_traffic
+
+COST_PER_BYTE = 250  # mutez
+GAS_LIMIT = 1040000
+BALANCE = "10000000"  # tez, enough to pay any redeem of the generated traffic
+STEP_FILE = re.compile(r"step_(\d+)_cont_0_(params|storage)\.tz$")
+REMAINING_GAS = re.compile(r"remaining gas: ([0-9.]+)")
+MICHELSON_TOKEN = re.compile(r'\s*(?:#[^\n]*\n\s*)*([(){};]|"(?:[^"\\]|\\.)*"|[^\s(){};]+)')
+
+# Forged transaction: branch, tag, source, fee, counter, gas and storage limits, destination,
+# parameters flag, parameters length and signature. The zarith fields are taken at their
+# usual size; the amount and entry point are added per call.
+OPERATION_OVERHEAD = 32 + 1 + 21 + 3 + 4 + 3 + 2 + 22 + 1 + 4 + 64
+
+
+def zarith_size(value):
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def tez(mutez):
+    return "%d.%06d" % divmod(mutez, 10 ** 6)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+# Michelson text, parsed into (prim, args) tuples, lists for sequences and strings for literals and annotations
+
+def parse_michelson(text):
+    tokens = MICHELSON_TOKEN.findall(text)
+    position = 0
+
+    def expression(with_args):
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        if token == "(":
+            node = expression(True)
+            position += 1  # )
+            return node
+        if token == "{":
+            items = []
+            while tokens[position] != "}":
+                if tokens[position] == ";":
+                    position += 1
+                else:
+                    items.append(expression(True))
+            position += 1
+            return items
+        if not token[0].isalpha():
+            return token
+        args = []
+        while with_args and position < len(tokens) and tokens[position] not in (")", "}", ";"):
+            args.append(expression(False))
+        return (token, args)
+
+    return expression(True)
+
+
+def to_michelson(node, top=True):
+    if isinstance(node, list):
+        return "{" + "; ".join(to_michelson(item) for item in node) + "}"
+    if isinstance(node, tuple) and node[1]:
+        text = " ".join([node[0]] + [to_michelson(arg, False) for arg in node[1]])
+        return text if top else "(" + text + ")"
+    if isinstance(node, tuple):
+        return node[0]
+    return node
+
+
+@functools.lru_cache()
+def storage_type(script):
+    """Storage type of a compiled contract."""
+    tokens = MICHELSON_TOKEN.findall(read(script))
+    depth = 0
+    for index, token in enumerate(tokens):
+        depth += token in ("(", "{")
+        depth -= token in (")", "}")
+        if depth <= 1 and token == "storage":
+            return parse_michelson(" ".join(tokens[index + 1:tokens.index(";", index)]))
+    raise RuntimeError("no storage type in %s" % script)
+
+
+def _type_args(node):
+    return [arg for arg in node[1] if not (isinstance(arg, str) and arg[0] in "%:@")]
+
+
+def _comb(node, arity):
+    """Components of a pair value or type, a right comb of more than two elements being split as pair a (pair b c)."""
+    items = node if isinstance(node, list) else (_type_args(node) if node[0] == "pair" else node[1])
+    if len(items) > arity:
+        rest = items[arity - 1:]
+        items = items[:arity - 1] + [rest if isinstance(node, list) else (node[0], rest)]
+    return items
+
+
+def extract_big_maps(storage, storage_type):
+    """Storage with every big_map replaced by an id, and the --extra-big-maps argument declaring them."""
+    big_maps = []
+
+    def walk(value, t):
+        prim = t[0]
+        if prim == "big_map":
+            key_type, value_type = _type_args(t)
+            big_maps.append("Big_map %d %s %s %s" % (
+                len(big_maps), to_michelson(key_type, False), to_michelson(value_type, False), to_michelson(value, False)))
+            return str(len(big_maps) - 1)
+        if prim == "pair":
+            types = _comb(t, 2)
+            values = _comb(value, 2)
+            return ("Pair", [walk(item, item_type) for item, item_type in zip(values, types)])
+        return value
+
+    storage = walk(parse_michelson(storage), storage_type)
+    return to_michelson(storage), "{" + "; ".join(big_maps) + "}"
+
+
+class Octez:
+    """Thin wrapper around octez-client in mockup mode, which needs no node."""
+
+    def __init__(self, client):
+        self.client = client
+        self.base_dir = tempfile.mkdtemp(prefix="tezbet-bench-")
+        self.run("create", "mockup")
+
+    def run(self, *args):
+        command = [self.client, "--mode", "mockup", "--base-dir", self.base_dir] + list(args)
+        return subprocess.run(command, check=True, capture_output=True, text=True).stdout
+
+    def binary_size(self, kind, michelson):
+        output = self.run("convert", kind, michelson, "from", "michelson", "to", "binary").strip()
+        return (len(output) - 2) // 2 if output.startswith("0x") else len(output) // 2
+
+    def gas(self, script, storage, params, call):
+        storage, big_maps = extract_big_maps(storage, storage_type(script))
+        command = [self.client, "--mode", "mockup", "--base-dir", self.base_dir,
+                   "run", "script", script, "on", "storage", storage, "and", "input", params,
+                   "--extra-big-maps", big_maps,
+                   "--entrypoint", call["entry_point"], "--amount", tez(call["amount"]),
+                   "--balance", BALANCE, "--source", call["sender"], "--payer", call["sender"],
+                   "--now", str(call["now"]), "--gas", str(GAS_LIMIT), "--trace-stack"]
+        remaining = None
+        # The trace holds the whole stack at every instruction, only the gas counter is kept
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as process:
+            for line in process.stdout:
+                for value in REMAINING_GAS.findall(line):
+                    remaining = float(value) if remaining is None else min(remaining, float(value))
+        if process.returncode != 0 or remaining is None:
+            raise RuntimeError("octez-client failed to run %s at %s" % (call["entry_point"], call["now"]))
+        return round(GAS_LIMIT - remaining, 3)
+
+
+class Sizer:
+    def __init__(self, octez):
+        self.octez = octez
+        self.unit = "binary" if octez else "text"
+
+    def data(self, michelson):
+        if self.octez:
+            return self.octez.binary_size("data", michelson)
+        return len(" ".join(michelson.split()).encode())
+
+    def script(self, path):
+        if self.octez:
+            return self.octez.binary_size("script", path)
+        return len(" ".join(read(path).split()).encode())
+
+
+def smartpy(cli, command, output):
+    subprocess.run([cli, command, "benchmark.py", output], check=True)
+
+
+def step_files(directory):
+    steps = {}
+    for name in os.listdir(directory):
+        match = STEP_FILE.match(name)
+        if match:
+            steps.setdefault(int(match.group(1)), {})[match.group(2)] = os.path.join(directory, name)
+    return steps
+
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return dict(mean=round(sum(values) / len(values), 3), max=max(values), min=min(values))
+
+
+def measure_calls(directory, script, calls, sizer, octez):
+    """Measures of every call, along with the origination and final storage sizes."""
+    steps = step_files(directory)
+    storage_steps = sorted(step for step, files in steps.items() if "storage" in files)
+    param_steps = sorted(step for step, files in steps.items() if "params" in files)
+    if len(param_steps) != len(calls):
+        raise RuntimeError("%s: %d calls in the SmartPy output, %d generated" % (directory, len(param_steps), len(calls)))
+
+    origination = read(steps[storage_steps[0]]["storage"])
+    storage = origination
+    size = sizer.data(storage)
+    high_water = size
+    measures = []
+    for step, call in zip(param_steps, calls):
+        params = read(steps[step]["params"])
+        after = read(steps[step]["storage"]) if "storage" in steps[step] else storage
+        new_size = sizer.data(after)
+        params_size = sizer.data(params)
+        measures.append(dict(
+            entry_point=call["entry_point"],
+            items=len(call["arg"]) if isinstance(call["arg"], list) else None,
+            gas=octez.gas(script, storage, params, call) if octez else None,
+            storage_delta=new_size - size,
+            paid_storage=max(0, new_size - high_water) * COST_PER_BYTE,
+            operation_bytes=OPERATION_OVERHEAD + zarith_size(call["amount"]) + 2 + len(call["entry_point"]) + params_size))
+        high_water = max(high_water, new_size)
+        storage, size = after, new_size
+    return measures, sizer.data(origination), size
+
+
+def measure_scenario(directory, script, calls, sizer, octez):
+    measures, origination_size, size = measure_calls(directory, script, calls, sizer, octez)
+    entry_points = {}
+    for entry_point in sorted(set(measure["entry_point"] for measure in measures)):
+        selected = [measure for measure in measures if measure["entry_point"] == entry_point]
+        entry_points[entry_point] = dict(
+            calls=len(selected),
+            gas=summarize(measure["gas"] for measure in selected),
+            storage_delta=summarize(measure["storage_delta"] for measure in selected),
+            paid_storage=sum(measure["paid_storage"] for measure in selected),
+            operation_bytes=summarize(measure["operation_bytes"] for measure in selected))
+        if any(measure["items"] for measure in selected):
+            entry_points[entry_point]["gas_per_item"] = summarize(
+                measure["gas"] / measure["items"] if measure["gas"] is not None and measure["items"] else None for measure in selected)
+    return dict(origination_storage=origination_size, final_storage=size, entry_points=entry_points)
+
+
+def check_flat_cost(directory, script, sizer, octez):
+    """Gas and storage of the probe calls at every point of PROBE_GRID that differ from the first point."""
+    probes = {}
+    for open_games in bench_traffic.PROBE_GRID:
+        name = bench_traffic.probe_name(open_games)
+        calls = bench_traffic.probe(open_games)
+        measures = measure_calls(os.path.join(directory, name), script, calls, sizer, octez)[0]
+        probes[name] = [measure for measure, call in zip(measures, calls) if call["probe"]]
+    names = [bench_traffic.probe_name(open_games) for open_games in bench_traffic.PROBE_GRID]
+    differences = []
+    for name in names[1:]:
+        for index, (reference, measure) in enumerate(zip(probes[names[0]], probes[name])):
+            for metric in ("gas", "storage_delta"):
+                if measure[metric] != reference[metric]:
+                    differences.append(dict(
+                        call=index, entry_point=measure["entry_point"], metric=metric,
+                        values={names[0]: reference[metric], name: measure[metric]}))
+    return differences
+
+
+def find(directory, suffix):
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.endswith(suffix):
+                return os.path.join(root, name)
+    raise RuntimeError("no %s file under %s" % (suffix, directory))
+
+
+def build_report(args):
+    octez = Octez(args.octez_client) if args.octez_client else None
+    sizer = Sizer(octez)
+    tests = os.path.join(args.output, "test")
+    compiled = os.path.join(args.output, "compile")
+    if not args.skip_smartpy:
+        smartpy(args.smartpy, "test", tests)
+        smartpy(args.smartpy, "compile", compiled)
+
+    script = find(os.path.join(compiled, "soccer_bet_factory"), "_contract.tz")
+    report = dict(
+        size_unit=sizer.unit,
+        gas_source="octez-client mockup" if octez else None,
+        script=dict(bytes=sizer.script(script)),
+        scenarios={})
+    for games, bettors, results_batch in bench_traffic.bench_points():
+        name = bench_traffic.scenario_name(games, bettors, results_batch)
+        report["scenarios"][name] = measure_scenario(
+            os.path.join(tests, name), script, bench_traffic.generate(games, bettors, results_batch=results_batch), sizer, octez)
+    report["flat_cost"] = dict(gas_measured=octez is not None, differences=check_flat_cost(tests, script, sizer, octez))
+    return report
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, prefix + "." + key if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare(report, baseline, tolerance):
+    """Prints the metrics that moved since the baseline and returns the regressions."""
+    old = dict(flatten(baseline))
+    regressions = []
+    for path, value in flatten(report):
+        if path not in old or path.endswith(".calls") or old[path] == value:
+            continue
+        change = (value - old[path]) / abs(old[path]) if old[path] else float("inf")
+        regressed = change > tolerance
+        print("%s %s: %s -> %s (%+.1f%%)" % ("!" if regressed else " ", path, old[path], value, 100 * change))
+        if regressed:
+            regressions.append(path)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--smartpy", default=os.environ.get("SMARTPY_CLI", os.path.expanduser("~/smartpy-cli/SmartPy.sh")))
+    parser.add_argument("--octez-client", default=shutil.which("octez-client"))
+    parser.add_argument("--output", default="bench_output")
+    parser.add_argument("--skip-smartpy", action="store_true", help="reuse the SmartPy output of a previous run")
+    parser.add_argument("--report", default="bench_report.json")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="relative increase reported as a regression")
+    args = parser.parse_args()
+
+    report = build_report(args)
+    with open(args.baseline if args.save_baseline else args.report, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    flat_cost = report["flat_cost"]
+    if not flat_cost["gas_measured"]:
+        print("! flat cost: gas not measured, octez-client is not available")
+    for difference in flat_cost["differences"]:
+        print("! %s of %s (probe call %d) depends on the number of open games: %s" % (
+            difference["metric"], difference["entry_point"], difference["call"], difference["values"]))
+    if not flat_cost["gas_measured"] or flat_cost["differences"]:
+        return 1
+    if args.save_baseline or not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("size_unit") != report["size_unit"]:
+        print("Baseline sizes are %s sizes, not comparable" % baseline.get("size_unit"))
+        return 1
+    return 1 if compare(report, baseline, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
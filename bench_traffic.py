@@ -0,0 +1,164 @@
+"""Deterministic traffic used by the benchmark scenarios.
+
+This module does not depend on SmartPy: benchmark.py replays the calls in the
+interpreter while bench_report.py reads the very same list to know which entry
+point, sender, amount and time produced each step of the SmartPy output.
+"""
+
+import hashlib
+import random
+
+# (games, bettors) grid replayed by benchmark.py
+BENCH_GRID = [(1, 10), (10, 10), (10, 50), (40, 50)]
+
+# (games, bettors, results per callback) grid where the outcomes are pushed by the oracle through receive_results
+ORACLE_GRID = [(40, 50, 10), (40, 50, 40), (200, 100, 100)]
+
+# Numbers of other open games around the probe game, whose bet, unbet and redeem must cost the same at every point
+PROBE_GRID = [1, 100]
+PROBE_GAME = 0
+
+START = 1640995200  # 2022-01-01T00:00:00Z
+KICKOFF_DELAY = 3 * 86400
+LATE_BET_DELAY = 12 * 3600  # below the day before kickoff from which the contract charges the service fee
+LATE_BETTORS = 0.3
+OUTCOMES = 3
+CANCELLED = 10
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_TZ1_PREFIX = bytes([6, 161, 159])
+
+
+def _b58check(payload):
+    data = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    number = int.from_bytes(data, "big")
+    encoded = ""
+    while number:
+        number, digit = divmod(number, 58)
+        encoded = _B58_ALPHABET[digit] + encoded
+    return "1" * (len(data) - len(data.lstrip(b"\0"))) + encoded
+
+
+def account(name):
+    """A well-formed tz1 address derived from a name, usable both in SmartPy and octez-client."""
+    return _b58check(_TZ1_PREFIX + hashlib.sha256(name.encode()).digest()[:20])
+
+
+ADMIN = account("Admin")
+ORACLE = account("Oracle")
+PROBER = account("Prober")
+
+
+def bench_points():
+    """(games, bettors, results_batch) of every benchmark scenario, results_batch being 0 when the admin posts the outcomes."""
+    return [(games, bettors, 0) for games, bettors in BENCH_GRID] + ORACLE_GRID
+
+
+def scenario_name(games, bettors, results_batch=0):
+    if results_batch:
+        return "bench_G%d_B%d_R%d" % (games, bettors, results_batch)
+    return "bench_G%d_B%d" % (games, bettors)
+
+
+def probe_name(open_games):
+    return "bench_probe_G%d" % open_games
+
+
+def probe(open_games):
+    """Returns the calls of a scenario where the same bets on PROBE_GAME are made next to `open_games` other games.
+
+    Every other game gets a bet of its own. The calls on the probe game are flagged with probe=True and
+    are the same whatever open_games is, so that their gas and storage can be compared across PROBE_GRID.
+    """
+    kickoff = START + KICKOFF_DELAY
+    calls = []
+
+    def call(entry_point, arg, sender, now, amount=0, probed=False):
+        calls.append(dict(entry_point=entry_point, arg=arg, sender=sender, amount=amount, now=now, probe=probed))
+
+    for game_id in range(open_games + 1):
+        call("new_game", dict(game_id=game_id, team_a="Team A", team_b="Team B", match_timestamp=kickoff, outcomes=OUTCOMES), ADMIN, START)
+    for game_id in range(1, open_games + 1):
+        call("bet", dict(game_id=game_id, choice=0), account("Bettor %d" % game_id), START + 60, 10 * 10 ** 6)
+
+    now = START + 3600
+    call("bet", dict(game_id=PROBE_GAME, choice=1), PROBER, now, 100 * 10 ** 6, True)
+    call("unbet", dict(game_id=PROBE_GAME, choice=1), PROBER, now + 1, probed=True)
+    call("bet", dict(game_id=PROBE_GAME, choice=1), PROBER, now + 2, 100 * 10 ** 6, True)
+    call("set_outcome", dict(game_id=PROBE_GAME, choice=1), ADMIN, kickoff + 7200)
+    call("redeem_tez", PROBE_GAME, PROBER, kickoff + 7260, probed=True)
+    return calls
+
+
+def generate(games, bettors, seed=0, results_batch=0):
+    """Returns the calls of a scenario with `games` games and `bettors` bettors.
+
+    Each call is a dict with the entry point, its argument, the sender, the amount
+    in mutez and the time of the call. Bettors place one to three bets, some of
+    them on the day of the match, some bets are removed before kickoff, then every
+    game gets an outcome and every winner redeems. With a results_batch, ORACLE is authorised first and pushes
+    the outcomes through receive_results, results_batch games per call.
+    """
+    rng = random.Random("%d-%d-%d" % (games, bettors, seed))
+    kickoff = START + KICKOFF_DELAY
+    calls = []
+    positions = {}
+
+    def call(entry_point, arg, sender, now, amount=0):
+        calls.append(dict(entry_point=entry_point, arg=arg, sender=sender, amount=amount, now=now))
+
+    if results_batch:
+        call("set_oracle", ORACLE, ADMIN, START)
+    for game_id in range(games):
+        call("new_game", dict(game_id=game_id, team_a="Team A", team_b="Team B", match_timestamp=kickoff, outcomes=OUTCOMES), ADMIN, START)
+
+    addresses = [account("Bettor %d" % index) for index in range(bettors)]
+    bets = []
+    for address in addresses:
+        late = rng.random() < LATE_BETTORS
+        for _ in range(rng.randint(1, 3)):
+            bets.append((late, address, rng.randrange(games), rng.randrange(OUTCOMES), rng.randint(1, 1000) * 10 ** 6))
+
+    # Early bets are placed right after the games open, the others on the day of the match
+    now = START + 60
+    for late_bets in (False, True):
+        if late_bets:
+            now = kickoff - LATE_BET_DELAY
+        for late, address, game_id, choice, amount in bets:
+            if late == late_bets:
+                stakes = positions.setdefault((game_id, address), {})
+                stakes[choice] = stakes.get(choice, 0) + amount
+                call("bet", dict(game_id=game_id, choice=choice), address, now, amount)
+                now += 1
+
+    # A tenth of the positions are removed before kickoff; those opened on the day of the match pay the service fee
+    for (game_id, address), stakes in sorted(positions.items()):
+        if rng.random() < 0.1:
+            choice = rng.choice(sorted(stakes)) if len(stakes) > 1 else -1
+            if choice == -1:
+                stakes.clear()
+            else:
+                del stakes[choice]
+            call("unbet", dict(game_id=game_id, choice=choice), address, now)
+            now += 1
+
+    outcomes = {}
+    for game_id in range(games):
+        outcome = CANCELLED if rng.random() < 0.05 else rng.randrange(OUTCOMES)
+        outcomes[game_id] = outcome
+        if not results_batch:
+            call("set_outcome", dict(game_id=game_id, choice=outcome), ADMIN, kickoff + 7200)
+    if results_batch:
+        for first in range(0, games, results_batch):
+            results = [dict(game_id=game_id, choice=outcomes[game_id]) for game_id in range(first, min(first + results_batch, games))]
+            call("receive_results", results, ORACLE, kickoff + 7200)
+
+    now = kickoff + 7200 + 60
+    for (game_id, address), stakes in sorted(positions.items()):
+        pools = [key for (other_game, _), other_stakes in positions.items() if other_game == game_id for key in other_stakes]
+        refund = outcomes[game_id] not in pools
+        if stakes and (refund or outcomes[game_id] in stakes):
+            call("redeem_tez", game_id, address, now)
+            now += 1
+
+    return calls
@@ -0,0 +1,53 @@
+import smartpy as sp
+
+main = sp.io.import_script_from_url("file:match_contract.py")
+traffic = sp.io.import_script_from_url("file:bench_traffic.py")
+
+# Replays the traffic of bench_traffic.py, one scenario per (games, bettors) point of BENCH_GRID
+# and one per number of open games of PROBE_GRID. bench_report.py maps the steps written by the
+# SmartPy CLI back to these calls, so only valid calls on the factory are run here.
+
+def argument(arg):
+    if isinstance(arg, list):
+        return sp.list([argument(item) for item in arg])
+    if isinstance(arg, str) and arg.startswith("tz"):
+        return sp.address(arg)
+    if not isinstance(arg, dict):
+        return arg
+    fields = dict(arg)
+    if "match_timestamp" in fields:
+        fields["match_timestamp"] = sp.timestamp(fields["match_timestamp"])
+    return sp.record(**fields)
+
+def replay(scenario, calls):
+    factory = main.SoccerBetFactory(sp.address(traffic.ADMIN))
+    scenario += factory
+    for call in calls:
+        scenario += getattr(factory, call["entry_point"])(argument(call["arg"])).run(
+            sender=sp.address(call["sender"]),
+            amount=sp.mutez(call["amount"]),
+            now=sp.timestamp(call["now"]))
+
+def add_benchmark(games, bettors, results_batch):
+    @sp.add_test(name=traffic.scenario_name(games, bettors, results_batch))
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Benchmark: %d games, %d bettors" % (games, bettors))
+        if results_batch:
+            scenario.p("Outcomes pushed by the oracle, %d games per callback" % results_batch)
+        replay(scenario, traffic.generate(games, bettors, results_batch=results_batch))
+
+def add_probe(open_games):
+    @sp.add_test(name=traffic.probe_name(open_games))
+    def test():
+        scenario = sp.test_scenario()
+        scenario.h1("Probe game next to %d open games" % open_games)
+        replay(scenario, traffic.probe(open_games))
+
+for games, bettors, results_batch in traffic.bench_points():
+    add_benchmark(games, bettors, results_batch)
+
+for open_games in traffic.PROBE_GRID:
+    add_probe(open_games)
+
+sp.add_compilation_target("soccer_bet_factory", main.SoccerBetFactory(sp.address(traffic.ADMIN)))
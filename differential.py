@@ -0,0 +1,91 @@
+import smartpy as sp
+
+main = sp.io.import_script_from_url("file:match_contract.py")
+model = sp.io.import_script_from_url("file:reference_model.py")
+
+# Replays sequences sampled by reference_model.py through the contract: every operation must be
+# accepted or rejected as the model predicts, and the storage must match the model once the
+# sampled sequence is over and once every game has been settled and redeemed.
+
+GAMES = 4
+BETTORS = 5
+STEPS = 24
+SEEDS = [0, 1, 2, 3]
+
+def verify_storage(scenario, factory, bettors, storage):
+    for game_id in range(GAMES):
+        if game_id not in storage["games"]:
+            scenario.verify(~factory.data.games.contains(game_id))
+            continue
+        expected = storage["games"][game_id]
+        game = factory.data.games[game_id]
+        scenario.verify(game.outcome == expected["outcome"])
+        scenario.verify(game.total_bet_amount == sp.mutez(expected["total_bet_amount"]))
+        scenario.verify(game.jackpot == sp.mutez(expected["jackpot"]))
+        scenario.verify(game.bettors == expected["bettors"])
+        for choice, amount in enumerate(expected["bet_amount_on"]):
+            scenario.verify(game.bet_amount_on.get(choice, default_value=sp.tez(0)) == sp.mutez(amount))
+        if expected["settlement"] is not None:
+            scenario.verify(game.settlement.refund == expected["settlement"]["refund"])
+            scenario.verify(game.settlement.unpaid == sp.mutez(expected["settlement"]["unpaid"]))
+            scenario.verify(game.settlement.to_pay == expected["settlement"]["to_pay"])
+
+    for game_id in range(GAMES):
+        for slot, bettor in enumerate(bettors):
+            key = sp.pair(game_id, bettor.address)
+            if (game_id, slot) not in storage["positions"]:
+                scenario.verify(~factory.data.bet_amount_by_user.contains(key))
+                continue
+            for choice, amount in enumerate(storage["positions"][(game_id, slot)]):
+                scenario.verify(factory.data.bet_amount_by_user[key].stakes.get(choice, default_value=sp.tez(0)) == sp.mutez(amount))
+
+    scenario.verify(factory.data.remainder == sp.mutez(storage["remainder"]))
+    scenario.verify(factory.balance == sp.mutez(storage["balance"]))
+
+def replay(seed):
+    market, trace = model.simulate(GAMES, BETTORS, STEPS, seed, record=True)
+    scenario = sp.test_scenario()
+    scenario.h1("Differential replay, seed %d" % seed)
+    admin = sp.test_account("Admin")
+    bettors = [sp.test_account("Bettor %d" % slot) for slot in range(BETTORS)]
+    factory = main.SoccerBetFactory(admin.address)
+    scenario += factory
+    scenario += factory.new_games(sp.list([sp.record(
+        game_id=game_id,
+        team_a="Team A",
+        team_b="Team B",
+        match_timestamp=sp.timestamp(int(market.match_time[game_id])),
+        outcomes=int(market.outcomes[game_id])) for game_id in range(GAMES)])).run(sender=admin)
+
+    for operation in trace:
+        kind = operation["kind"]
+        if kind == "checkpoint":
+            scenario.h2("Storage after the sampled sequence")
+            verify_storage(scenario, factory, bettors, operation["storage"])
+            scenario.h2("Settling and redeeming every game")
+            continue
+        now = sp.timestamp(operation["now"])
+        if kind == "set_outcome":
+            scenario += factory.set_outcome(sp.record(game_id=operation["game_id"], choice=operation["choice"])).run(
+                sender=admin.address, now=now, valid=operation["ok"])
+            continue
+        sender = bettors[operation["bettor"]].address
+        if kind == "bet":
+            scenario += factory.bet(sp.record(game_id=operation["game_id"], choice=operation["choice"])).run(
+                sender=sender, amount=sp.mutez(operation["amount"]), now=now, valid=operation["ok"])
+        elif kind == "unbet":
+            scenario += factory.unbet(sp.record(game_id=operation["game_id"], choice=operation["choice"])).run(
+                sender=sender, now=now, valid=operation["ok"])
+        else:
+            scenario += factory.redeem_tez(operation["game_id"]).run(sender=sender, now=now, valid=operation["ok"])
+
+    scenario.h2("Storage once every game is settled")
+    verify_storage(scenario, factory, bettors, market.storage())
+
+def add_replay(seed):
+    @sp.add_test(name="Differential replay %d" % seed)
+    def test():
+        replay(seed)
+
+for seed in SEEDS:
+    add_replay(seed)
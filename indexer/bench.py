@@ -0,0 +1,57 @@
+"""Throughput of the indexer on the stand-in feed.
+
+    python -m indexer.bench --games 5000 --bettors 20000 --operations 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from .feed import synthetic_feed
+from .state import Indexer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures ingestion and query throughput of the indexer")
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--bettors", type=int, default=20000)
+    parser.add_argument("--operations", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200000)
+    parser.add_argument("--legacy", action="store_true", help="use the entry points of the first version of the contract")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Generated beforehand so that only ingestion is timed
+    transactions = list(synthetic_feed(args.games, args.bettors, args.operations, args.seed, args.legacy))
+    indexer = Indexer()
+    started = time.perf_counter()
+    indexer.ingest(transactions)
+    elapsed = time.perf_counter() - started
+    print("ingest: %d operations in %.2fs, %.0f operations/s" % (len(transactions), elapsed, len(transactions) / elapsed))
+
+    rng = random.Random(args.seed)
+    game_ids = list(indexer.game_rows)
+    addresses = indexer.addresses
+    for name, query, keys in (("odds", indexer.odds, game_ids), ("exposure", indexer.exposure, addresses)):
+        sample = [rng.choice(keys) for _ in range(args.queries)]
+        started = time.perf_counter()
+        for key in sample:
+            query(key)
+        elapsed = time.perf_counter() - started
+        print("%s: %.2f us per query" % (name, 1e6 * elapsed / args.queries))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshot.zip")
+        started = time.perf_counter()
+        indexer.snapshot(path)
+        written = time.perf_counter() - started
+        started = time.perf_counter()
+        Indexer.restore(path)
+        restored = time.perf_counter() - started
+        print("snapshot: %d bytes, written in %.2fs, restored in %.2fs" % (os.path.getsize(path), written, restored))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import heapq
+import json
+import random
+
+from .operations import LEGACY_CHOICES
+
+START = 1640995200  # 2022-01-01T00:00:00Z
+LEGACY_NAMES = {choice: name for name, choice in LEGACY_CHOICES.items()}
+
+
+def read_operations(path, skip=0):
+    """Transactions of a JSON lines file, one per line, after the first skip ones."""
+    with open(path) as f:
+        for number, line in enumerate(f):
+            if number >= skip and line.strip():
+                yield json.loads(line)
+
+
+def synthetic_feed(games, bettors, operations, seed=0, legacy=False):
+    """In-process stand-in for the contract's transaction stream.
+
+    Keeps `games` games open for bets at all times. The clock moves one second per step and
+    games kick off one hour to three days after they are created: bettors bet and remove bets
+    until kickoff, then the games are given an outcome in kickoff order, redeemed by their
+    winners and replaced by new ones. Every transaction yielded is one the contract would
+    have applied. With legacy set, bets and removals use the bet_on_* and unbet_on_* entry
+    points of the first version of the contract.
+    """
+    rng = random.Random(seed)
+    addresses = ["tz1Bettor%07d" % index for index in range(bettors)]
+    now = START
+    next_game = 0
+    open_games = []  # games that have not kicked off yet
+    kickoffs = []  # heap of (match_timestamp, game_id) of the games without an outcome
+    match_times = {}  # game_id -> match_timestamp
+    positions = {}  # game_id -> {address: set of choices}
+    emitted = 0
+
+    def transaction(entrypoint, parameter, sender, amount=0):
+        return dict(entrypoint=entrypoint, parameter=parameter, sender=sender, amount=amount, timestamp=now)
+
+    def new_game():
+        nonlocal next_game
+        game_id = next_game
+        next_game += 1
+        open_games.append(game_id)
+        positions[game_id] = {}
+        match_times[game_id] = now + rng.randint(3600, 3 * 86400)
+        heapq.heappush(kickoffs, (match_times[game_id], game_id))
+        return transaction("new_game", dict(
+            game_id=game_id, team_a="Team A", team_b="Team B", match_timestamp=match_times[game_id], outcomes=3), "admin")
+
+    def betting_game():
+        """A game still open for bets, closing the ones drawn after their kickoff."""
+        index = rng.randrange(len(open_games))
+        game_id = open_games[index]
+        if match_times[game_id] > now:
+            return game_id
+        open_games[index] = open_games[-1]
+        open_games.pop()
+        return None
+
+    while emitted < operations:
+        now += 1
+        draw = rng.random()
+        if len(open_games) < games:
+            batch = [new_game()]
+        elif draw < 0.8:
+            game_id = betting_game()
+            if game_id is None:
+                continue
+            address = rng.choice(addresses)
+            choice = rng.randrange(3)
+            positions[game_id].setdefault(address, set()).add(choice)
+            amount = rng.randint(1, 10 ** 9)
+            if legacy:
+                batch = [transaction("bet_on_" + LEGACY_NAMES[choice], game_id, address, amount)]
+            else:
+                batch = [transaction("bet", dict(game_id=game_id, choice=choice), address, amount)]
+        elif draw < 0.95:
+            game_id = betting_game()
+            if game_id is None or not positions[game_id]:
+                continue
+            address = rng.choice(list(positions[game_id]))
+            choices = positions[game_id][address]
+            choice = rng.choice(sorted(choices)) if rng.random() < 0.5 else -1
+            if choice == -1 or len(choices) == 1:
+                del positions[game_id][address]
+            else:
+                choices.discard(choice)
+            if legacy:
+                batch = [transaction("unbet_all" if choice == -1 else "unbet_on_" + LEGACY_NAMES[choice], game_id, address)]
+            else:
+                batch = [transaction("unbet", dict(game_id=game_id, choice=choice), address)]
+        else:
+            # Results are posted once the match has started, for the game that kicked off first
+            if not kickoffs or kickoffs[0][0] >= now:
+                continue
+            game_id = heapq.heappop(kickoffs)[1]
+            outcome = rng.randrange(3)
+            holders = positions.pop(game_id)
+            winners = [address for address, choices in holders.items() if outcome in choices] or list(holders)
+            batch = [transaction("set_outcome", dict(game_id=game_id, choice=outcome), "admin")]
+            batch += [transaction("redeem_tez", game_id, address) for address in winners]
+        for item in batch[:operations - emitted]:
+            yield item
+        emitted += len(batch)
@@ -0,0 +1,589 @@
+"""Streaming decoder for Micheline JSON dumps of the SoccerBetFactory storage.
+
+The dump is memory-mapped and tokenised in place, and values are decoded against the
+storage type of the contract. Maps and big_maps on the streamed paths are never built:
+each element is yielded as soon as it is decoded, as (path, keys, value) where keys holds
+the keys of the enclosing streamed maps. This works for the current layout, where
+bet_amount_by_user is a big_map keyed by (game_id, address), and for the first one, where
+every game record holds its own bet_amount_by_user map.
+
+    storage_type = load_storage_type("soccer_bet_factory_contract.json")
+    for table, chunk in columns("storage.json", storage_type):
+        ...
+"""
+
+import datetime
+import hashlib
+import json
+import mmap
+import re
+from array import array
+from collections import namedtuple
+
+_TOKEN = re.compile(rb'\s*(?:([\[\]{}:,])|"((?:[^"\\]|\\.)*)"|(-?[0-9][0-9.eE+-]*)|(true|false|null))')
+_WHITESPACE = re.compile(r"\s*")
+_MICHELSON_TOKEN = re.compile(r'\s*(?:#[^\n]*\n\s*)*([()]|[;{}]|"(?:[^"\\]|\\.)*"|[^\s();{}]+)')
+
+# Marks the fields whose content was yielded element by element instead of being decoded in place
+STREAMED = "<streamed>"
+
+_B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_IMPLICIT_PREFIXES = {0: bytes([6, 161, 159]), 1: bytes([6, 161, 161]), 2: bytes([6, 161, 164]), 3: bytes([6, 161, 166])}
+_ORIGINATED_PREFIX = bytes([2, 90, 121])
+# Tag of the implicit account for each public key prefix (4 bytes once decoded)
+_KEY_TAGS = {"edpk": 0, "sppk": 1, "p2pk": 2}
+
+
+class MichelsonType(namedtuple("MichelsonType", "prim args field")):
+    """A Michelson type, pairs of more than two elements being nested to the right."""
+
+    def __new__(cls, prim, args=(), field=None):
+        args = tuple(args)
+        if prim == "pair" and len(args) > 2:
+            args = (args[0], MichelsonType("pair", args[1:]))
+        return super().__new__(cls, prim, args, field)
+
+
+def _type_from_json(node):
+    field = next((annot[1:] for annot in node.get("annots", []) if annot.startswith("%")), None)
+    return MichelsonType(node["prim"], [_type_from_json(arg) for arg in node.get("args", [])], field)
+
+
+def _type_from_michelson(tokens, top=False):
+    """Parses a type expression from a list of Michelson tokens, consuming them.
+
+    Arguments are only taken inside parentheses, or at the top of the storage section.
+    """
+    if tokens[0] == "(":
+        tokens.pop(0)
+        t = _type_from_michelson(tokens, top=True)
+        tokens.pop(0)
+        return t
+    prim = tokens.pop(0)
+    field = None
+    while tokens and tokens[0][0] in "%:@":
+        annot = tokens.pop(0)
+        if annot.startswith("%"):
+            field = annot[1:]
+    args = []
+    while top and tokens and tokens[0] not in (";", ")", "}"):
+        args.append(_type_from_michelson(tokens))
+    return MichelsonType(prim, args, field)
+
+
+def load_storage_type(path):
+    """Storage type of a compiled contract, either Micheline JSON (.json) or Michelson (.tz)."""
+    with open(path) as f:
+        source = f.read()
+    if path.endswith(".json"):
+        script = json.loads(source)
+        sections = script["code"] if isinstance(script, dict) else script
+        return _type_from_json(next(section for section in sections if section.get("prim") == "storage")["args"][0])
+    tokens = _MICHELSON_TOKEN.findall(source)
+    start = next(index for index, token in enumerate(tokens) if token == "storage")
+    return _type_from_michelson(tokens[start + 1:], top=True)
+
+
+def default_streamed(storage_type):
+    """Paths streamed by default: every big_map, every map of the storage record and every bet_amount_by_user map."""
+    paths = set()
+
+    def walk(t, path, top):
+        if t.prim in ("map", "big_map"):
+            if t.prim == "big_map" or top or path.endswith("bet_amount_by_user"):
+                paths.add(path)
+            walk(t.args[1], path, False)
+        elif t.prim == "pair":
+            for arg in t.args:
+                walk(arg, _child(path, arg), top)
+        elif t.prim in ("option", "list", "set", "or"):
+            for arg in t.args:
+                walk(arg, path, False)
+
+    walk(storage_type, "", True)
+    return paths
+
+
+def _child(path, t):
+    if t.field is None:
+        return path
+    return path + "." + t.field if path else t.field
+
+
+def _b58check(payload):
+    data = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    number = int.from_bytes(data, "big")
+    encoded = ""
+    while number:
+        number, digit = divmod(number, 58)
+        encoded = _B58_ALPHABET[digit] + encoded
+    return "1" * (len(data) - len(data.lstrip(b"\0"))) + encoded
+
+
+def _address(raw):
+    data = bytes.fromhex(raw)
+    if data[0] == 0:
+        return _b58check(_IMPLICIT_PREFIXES[data[1]] + data[2:22])
+    return _b58check(_ORIGINATED_PREFIX + data[1:21])
+
+
+def _b58decode(text):
+    """Payload of a base58check string, the checksum being dropped unchecked."""
+    number = 0
+    for char in text:
+        number = number * 58 + _B58_ALPHABET.index(char)
+    data = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return (b"\0" * (len(text) - len(text.lstrip("1"))) + data)[:-4]
+
+
+def key_address(key):
+    """Implicit account of a public key, in base58 or as Micheline bytes (tag then key)."""
+    if key[:4] in _KEY_TAGS:
+        tag, data = _KEY_TAGS[key[:4]], _b58decode(key)[4:]
+    else:
+        data = bytes.fromhex(key)
+        tag, data = data[0], data[1:]
+    return _b58check(_IMPLICIT_PREFIXES[tag] + hashlib.blake2b(data, digest_size=20).digest())
+
+
+def _timestamp(key, raw):
+    if key == "int":
+        return int(raw)
+    return int(datetime.datetime.fromisoformat(raw.replace("Z", "+00:00")).timestamp())
+
+
+class _Pair(namedtuple("_Pair", "left right")):
+    pass
+
+
+class _Tokens:
+    WINDOW = 1 << 20
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+        self.window = None
+        self.window_start = self.window_end = 0
+        self.window_ascii = True
+
+    def next(self):
+        match = _TOKEN.match(self.buffer, self.pos)
+        if match is None:
+            raise ValueError("invalid JSON at offset %d" % self.pos)
+        self.pos = match.end()
+        punctuation, string, number, literal = match.groups()
+        if punctuation is not None:
+            return punctuation.decode(), None
+        if string is not None:
+            return "string", json.loads(b'"' + string + b'"') if b"\\" in string else string.decode()
+        if number is not None:
+            return "number", number.decode()
+        return "literal", literal.decode()
+
+    def peek(self):
+        pos = self.pos
+        token = self.next()
+        self.pos = pos
+        return token[0]
+
+    def expect(self, kind):
+        token, value = self.next()
+        if token != kind:
+            raise ValueError("expected %r at offset %d, found %r" % (kind, self.pos, token))
+        return value
+
+    def skip(self):
+        """Skips a whole JSON value without building it."""
+        depth = 0
+        while True:
+            token, _ = self.next()
+            if token in "[{":
+                depth += 1
+            elif token in "]}":
+                depth -= 1
+            if depth == 0 and token not in ":,":
+                return
+
+    def _fill(self, size):
+        chunk = bytes(self.buffer[self.pos:self.pos + size])
+        # A character cut at the end of the chunk is dropped, the value being read again from a larger window if needed
+        self.window = chunk.decode("utf-8", errors="ignore")
+        self.window_start, self.window_end = self.pos, self.pos + len(chunk)
+        self.window_ascii = len(self.window) == len(chunk)
+
+    def raw(self):
+        """Reads a whole JSON object with the C decoder, from a window of the buffer around the current position."""
+        size = self.WINDOW
+        while True:
+            if self.window is None or not self.window_start <= self.pos < self.window_end:
+                self._fill(size)
+            if self.window_ascii:
+                index = self.pos - self.window_start
+            else:
+                index = len(bytes(self.buffer[self.window_start:self.pos]).decode("utf-8"))
+            index = _WHITESPACE.match(self.window, index).end()
+            try:
+                value, end = self.decoder.raw_decode(self.window, index)
+            except json.JSONDecodeError:
+                if self.window_end >= len(self.buffer):
+                    raise
+                # Only a value larger than the window makes it grow
+                if self.window_start == self.pos:
+                    size = 2 * (self.window_end - self.window_start)
+                self._fill(size)
+                continue
+            self.pos = self.window_start + (end if self.window_ascii else len(self.window[:end].encode()))
+            return value
+
+    def generic(self):
+        """Builds a JSON value, for the parts of the storage decoded without their type."""
+        start = self.pos
+        self.skip()
+        return json.loads(bytes(self.buffer[start:self.pos]))
+
+
+class StorageDecoder:
+    def __init__(self, storage_type, streamed=None):
+        self.type = storage_type
+        self.streamed = default_streamed(storage_type) if streamed is None else set(streamed)
+
+    def events(self, path):
+        """Yields (path, keys, value) for every element of the streamed maps, then ("", (), storage)."""
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            self.tokens = _Tokens(buffer)
+            storage = yield from self._value(self.type, "", ())
+            yield "", (), storage
+
+    # Values are walked against their type. Pairs come back as _Pair trees, which _shape turns into
+    # records (every leaf annotated) or tuples once the whole pair has been read.
+
+    def _value(self, t, path, keys):
+        return self._shape(t, (yield from self._walk(t, path, keys)))
+
+    def _walk(self, t, path, keys):
+        tokens = self.tokens
+        if t.prim in ("map", "big_map") and path in self.streamed:
+            yield from self._stream_map(t, path, keys)
+            return STREAMED
+        token = tokens.peek()
+        if token == "[":
+            return (yield from self._sequence(t, path, keys))
+        tokens.expect("{")
+        key = tokens.expect("string")
+        tokens.expect(":")
+        if key in ("int", "string", "bytes"):
+            raw = tokens.next()[1]
+            self._close_object()
+            return self._scalar(t, key, raw)
+        if key != "prim":
+            raise ValueError("unexpected %r at offset %d" % (key, tokens.pos))
+        prim = tokens.expect("string")
+        value = {"True": True, "False": False}.get(prim)
+        while tokens.next()[0] == ",":
+            key = tokens.expect("string")
+            tokens.expect(":")
+            if key != "args":
+                tokens.skip()
+            elif prim == "Pair":
+                value = yield from self._comb(t, path, keys)
+            elif prim in ("Some", "Left", "Right"):
+                tokens.expect("[")
+                inner = t.args[1] if prim == "Right" else t.args[0]
+                value = yield from self._value(inner, path, keys)
+                tokens.expect("]")
+                if prim != "Some":
+                    value = (prim, value)
+            else:
+                value = tokens.generic()
+        return value
+
+    def _close_object(self):
+        while self.tokens.next()[0] == ",":
+            self.tokens.expect("string")
+            self.tokens.expect(":")
+            self.tokens.skip()
+
+    def _scalar(self, t, key, raw):
+        if t.prim in ("int", "nat", "mutez"):
+            return int(raw)
+        if t.prim == "timestamp":
+            return _timestamp(key, raw)
+        if t.prim in ("address", "contract") and key == "bytes":
+            return _address(raw)
+        if t.prim in ("map", "big_map") and key == "int":
+            return {"big_map": int(raw)}
+        return raw
+
+    def _sequence(self, t, path, keys):
+        tokens = self.tokens
+        if t.prim == "pair":
+            return (yield from self._comb(t, path, keys))
+        if t.prim not in ("list", "set", "map", "big_map"):
+            return tokens.generic()
+        values = {} if t.prim in ("map", "big_map") else []
+        tokens.expect("[")
+        if tokens.peek() == "]":
+            tokens.next()
+            return values
+        while True:
+            if t.prim in ("list", "set"):
+                values.append((yield from self._value(t.args[0], path, keys)))
+            else:
+                key, value = yield from self._element(t, path, keys)
+                values[key] = value
+            if tokens.next()[0] == "]":
+                return values
+
+    def _element(self, t, path, keys):
+        """Reads an Elt of a map of type t, returning its key and value."""
+        tokens = self.tokens
+        tokens.expect("{")
+        while True:
+            key = tokens.expect("string")
+            tokens.expect(":")
+            if key == "args":
+                break
+            tokens.skip()
+            tokens.expect(",")
+        tokens.expect("[")
+        key = yield from self._value(t.args[0], path + "#key", keys)
+        tokens.expect(",")
+        value = yield from self._value(t.args[1], path, keys + (key,))
+        tokens.expect("]")
+        self._close_object()
+        return key, value
+
+    def _stream_map(self, t, path, keys):
+        tokens = self.tokens
+        if tokens.peek() == "{":
+            # A big_map id: the dump does not hold its content
+            tokens.skip()
+            return
+        tokens.expect("[")
+        if tokens.peek() == "]":
+            tokens.next()
+            return
+        # Elements holding no streamed map are read in one go and decoded in memory
+        whole = not any(streamed.startswith(path + ".") for streamed in self.streamed)
+        while True:
+            if whole:
+                element = tokens.raw()["args"]
+                key, value = self._decode(t.args[0], element[0]), self._decode(t.args[1], element[1])
+            else:
+                key, value = yield from self._element(t, path, keys)
+            yield path, keys + (key,), value
+            if tokens.next()[0] == "]":
+                return
+
+    def _decode(self, t, node):
+        """Decodes a value already loaded by the JSON decoder."""
+        if isinstance(node, list):
+            if t.prim in ("list", "set"):
+                return [self._decode(t.args[0], item) for item in node]
+            if t.prim in ("map", "big_map"):
+                return {self._decode(t.args[0], item["args"][0]): self._decode(t.args[1], item["args"][1]) for item in node}
+            if t.prim == "pair":
+                return self._shape(t, self._decode_comb(t, node))
+            return node
+        for key in ("int", "string", "bytes"):
+            if key in node:
+                return self._scalar(t, key, node[key])
+        prim, args = node["prim"], node.get("args", [])
+        if prim == "Pair":
+            return self._shape(t, self._decode_comb(t, args))
+        if prim == "Some":
+            return self._decode(t.args[0], args[0])
+        if prim in ("Left", "Right"):
+            return prim, self._decode(t.args[1] if prim == "Right" else t.args[0], args[0])
+        return {"True": True, "False": False, "None": None, "Unit": None}.get(prim, node)
+
+    def _decode_comb(self, t, args):
+        left = self._decode_raw(t.args[0], args[0])
+        if len(args) == 2:
+            return _Pair(left, self._decode_raw(t.args[1], args[1]))
+        return _Pair(left, self._decode_comb(t.args[1], args[1:]))
+
+    def _decode_raw(self, t, node):
+        # Pairs stay _Pair trees until the enclosing pair is shaped, as in _walk
+        if t.prim == "pair":
+            return self._decode_comb(t, node if isinstance(node, list) else node["args"])
+        return self._decode(t, node)
+
+    def _comb(self, t, path, keys):
+        """Reads the arguments of a Pair, or a sequence standing for one, flattened to the right or not."""
+        tokens = self.tokens
+        tokens.expect("[")
+        pieces = []
+        remaining = t
+        # A Pair has two arguments at least, the first one is never the whole pair
+        while remaining.prim == "pair" and (remaining is t or not self._whole(remaining)):
+            left = remaining.args[0]
+            pieces.append((yield from self._walk(left, _child(path, left), keys)))
+            tokens.expect(",")
+            remaining = remaining.args[1]
+        value = yield from self._walk(remaining, _child(path, remaining), keys)
+        tokens.expect("]")
+        for piece in reversed(pieces):
+            value = _Pair(piece, value)
+        return value
+
+    def _whole(self, t):
+        """Whether the next argument is the value of the whole pair t rather than of its left side."""
+        tokens = self.tokens
+        pos = tokens.pos
+        token = tokens.next()[0]
+        is_pair = token == "{" and tokens.next()[1] == "prim" and tokens.next()[0] == ":" and tokens.next()[1] == "Pair"
+        tokens.pos = pos
+        left = t.args[0]
+        if token != "[" and not is_pair:
+            return False
+        if left.prim == "pair":
+            # Only the position of the argument tells: it is the whole pair when it is the last one
+            tokens.skip()
+            last = tokens.peek() == "]"
+            tokens.pos = pos
+            return last
+        return not (token == "[" and left.prim in ("list", "set", "map", "big_map", "lambda"))
+
+    def _shape(self, t, value):
+        if t.prim != "pair" or not isinstance(value, _Pair):
+            return value
+        leaves = []
+
+        def collect(t, value, root):
+            if t.prim == "pair" and (root or t.field is None) and isinstance(value, _Pair):
+                collect(t.args[0], value.left, False)
+                collect(t.args[1], value.right, False)
+            else:
+                leaves.append((t.field, self._shape(t, value)))
+
+        collect(t, value, True)
+        if all(field is not None for field, _ in leaves):
+            return {field: value for field, value in leaves}
+        return tuple(value for _, value in leaves)
+
+
+# Contract events
+
+# Fields of every event payload, in the right comb order of match_contract.EVENT_TYPES
+EVENT_FIELDS = {
+    "bet": ("game_id", "bettor", "choice", "amount"),
+    "unbet": ("game_id", "bettor", "choice", "amount", "fee"),
+    "redeem": ("game_id", "bettor", "amount"),
+    "outcome": ("game_id", "outcome"),
+    "settlement": ("game_id", "outcome", "refund", "pool", "winning_pool"),
+    "game_deleted": ("game_id", "remainder"),
+    "prune": ("game_id", "bettor"),
+}
+
+
+def _leaves(node):
+    if isinstance(node, list):
+        for item in node:
+            yield from _leaves(item)
+    elif node.get("prim") == "Pair":
+        for arg in node["args"]:
+            yield from _leaves(arg)
+    else:
+        yield node
+
+
+def _event_value(field, raw):
+    if isinstance(raw, dict):
+        if "prim" in raw:
+            return raw["prim"] == "True"
+        (key, raw), = raw.items()
+        if key == "bytes":
+            return _address(raw)
+    if field == "bettor":
+        return raw
+    if isinstance(raw, bool):
+        return raw
+    return int(raw)
+
+
+def decode_event(tag, payload):
+    """Fields of an event emitted by the contract, from its Micheline payload or the JSON an indexer API serves for it.
+
+    Raises ValueError for an unknown tag or a payload that does not have the fields of its tag.
+    """
+    if tag not in EVENT_FIELDS:
+        raise ValueError("unknown event %r" % tag)
+    fields = EVENT_FIELDS[tag]
+    if isinstance(payload, dict) and "prim" not in payload:
+        if set(payload) != set(fields):
+            raise ValueError("%s event with fields %s" % (tag, sorted(payload)))
+        return {field: _event_value(field, payload[field]) for field in fields}
+    values = list(_leaves(payload))
+    if len(values) != len(fields):
+        raise ValueError("%s event with %d values" % (tag, len(values)))
+    return {field: _event_value(field, value) for field, value in zip(fields, values)}
+
+
+# Columnar output
+
+MAX_OUTCOMES = 10  # outcomes are numbered below CANCELLED
+LEGACY_OUTCOMES = ("team_a", "team_b", "tie")
+
+# One amount column per outcome: on_<outcome> for the pools of a game, stake_<outcome> for a position
+GAME_COLUMNS = ("game_id", "match_timestamp", "outcome", "total_bet_amount", "jackpot") + tuple("on_%d" % choice for choice in range(MAX_OUTCOMES))
+POSITION_COLUMNS = ("game_id", "address", "timestamp") + tuple("stake_%d" % choice for choice in range(MAX_OUTCOMES))
+
+
+def _by_outcome(amounts):
+    """Amounts on every outcome, from the team_a/team_b/tie record of the first layout or the map keyed by outcome."""
+    if "team_a" in amounts:
+        amounts = {choice: amounts[name] for choice, name in enumerate(LEGACY_OUTCOMES)}
+    return tuple(amounts.get(choice, 0) for choice in range(MAX_OUTCOMES))
+
+
+def rows(events):
+    """Normalises decoded events into ("games", row) and ("positions", row) tuples, in POSITION/GAME_COLUMNS order."""
+    for path, keys, value in events:
+        if path == "games":
+            game_id = keys[0]
+            bet_amount_on = value["bet_amount_on"]
+            yield "games", (game_id, value["match_timestamp"], value["outcome"], value["total_bet_amount"], value["jackpot"]) + _by_outcome(bet_amount_on)
+        elif path in ("games.bet_amount_by_user", "bet_amount_by_user"):
+            # Keyed by game then address in the first layout, by the (game_id, address) pair since
+            game_id, address = keys if len(keys) == 2 else keys[0]
+            stakes = value["stakes"] if "stakes" in value else value
+            yield "positions", (game_id, address, value["timestamp"]) + _by_outcome(stakes)
+
+
+def columns(path, storage_type, chunk_size=1 << 16, streamed=None):
+    """Yields ("games" or "positions", chunk) where chunk maps every column to an int64 array of at most chunk_size rows.
+
+    Addresses are replaced by their index in the `addresses` list passed along with every chunk,
+    so that memory stays bounded by the chunk size and the number of distinct bettors.
+    """
+    decoder = StorageDecoder(storage_type, streamed)
+    addresses = []
+    address_index = {}
+    tables = {"games": GAME_COLUMNS, "positions": POSITION_COLUMNS}
+    chunks = {name: {column: array("q") for column in names} for name, names in tables.items()}
+    sizes = {name: 0 for name in tables}
+
+    def flush(name):
+        chunk = dict(chunks[name], addresses=addresses)
+        chunks[name] = {column: array("q") for column in tables[name]}
+        sizes[name] = 0
+        return name, chunk
+
+    for name, row in rows(decoder.events(path)):
+        if name == "positions":
+            address = row[1]
+            index = address_index.get(address)
+            if index is None:
+                index = address_index[address] = len(addresses)
+                addresses.append(address)
+            row = (row[0], index) + row[2:]
+        for column, value in zip(tables[name], row):
+            chunks[name][column].append(value)
+        sizes[name] += 1
+        if sizes[name] == chunk_size:
+            yield flush(name)
+    for name in tables:
+        if sizes[name]:
+            yield flush(name)
@@ -0,0 +1,124 @@
+import datetime
+from collections import namedtuple
+
+from .micheline import decode_event, key_address
+
+CANCELLED = 10
+
+# kind is one of new_game, new_market, bet, unbet, ticket_bet, ticket_unbet, set_outcome, redeem and game_deleted;
+# choice is -1 for unbets of every outcome. opened is the time a ticket was issued, from which its unbet fee is computed.
+Operation = namedtuple("Operation", "kind game_id choice amount sender timestamp match_timestamp outcomes opened", defaults=(0,))
+
+# Entry points of the first version of the contract, before bets were keyed by outcome
+LEGACY_CHOICES = {"team_a": 0, "team_b": 1, "tie": 2}
+LEGACY_OUTCOMES = 3
+
+
+def _int(value):
+    return int(value)
+
+
+def _timestamp(value):
+    if isinstance(value, str) and not value.lstrip("-").isdigit():
+        return int(datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+    return int(value)
+
+
+def _fields(raw):
+    """Entry point, parameter, sender, amount and time of an operation, flat or as served by an indexer API."""
+    parameter = raw.get("parameter", raw.get("parameters", raw.get("arg")))
+    entrypoint = raw.get("entrypoint", raw.get("entry_point"))
+    if entrypoint is None and isinstance(parameter, dict) and "entrypoint" in parameter:
+        entrypoint, parameter = parameter["entrypoint"], parameter.get("value")
+    sender = raw.get("sender")
+    if isinstance(sender, dict):
+        sender = sender["address"]
+    return entrypoint, parameter, sender, _int(raw.get("amount", 0)), _timestamp(raw.get("timestamp", raw.get("now", 0)))
+
+
+def _ticket(ticket):
+    """Content and amount of a ticket, as (game_id, choice, timestamp, amount)."""
+    content = ticket.get("content", ticket.get("data", ticket.get("value")))
+    return _int(content["game_id"]), _int(content["choice"]), _timestamp(content["timestamp"]), _int(ticket["amount"])
+
+
+def _events(raw):
+    """(tag, payload) of the events emitted by a transaction, listed under events or as event internal operations."""
+    for event in raw.get("events", ()):
+        yield event["tag"], event["payload"]
+    for result in raw.get("metadata", {}).get("internal_operation_results", ()):
+        if result.get("kind") == "event":
+            yield result["tag"], result["payload"]
+
+
+def _new_game(game, timestamp, kind="new_game"):
+    return Operation(kind, _int(game["game_id"]), -1, 0, None, timestamp,
+                     _timestamp(game["match_timestamp"]), _int(game.get("outcomes", LEGACY_OUTCOMES)))
+
+
+def normalize(raw):
+    """Operations applied by one transaction of the feed, batch entry points expanding to several.
+
+    Positions paid or pruned by settle_batch and sweep, and games deleted by the contract, are only
+    known from the events of the transaction. Failed transactions and entry points that do not move
+    the aggregates give an empty list.
+    """
+    if raw.get("status", "applied") != "applied":
+        return []
+    entrypoint, parameter, sender, amount, timestamp = _fields(raw)
+    if entrypoint is None:
+        return []
+    operations = _from_parameter(entrypoint, parameter, sender, amount, timestamp)
+    for tag, payload in _events(raw):
+        if tag in ("redeem", "prune") and entrypoint in ("settle_batch", "sweep"):
+            event = decode_event(tag, payload)
+            operations.append(Operation("redeem", event["game_id"], -1, event.get("amount", 0), event["bettor"], timestamp, 0, 0))
+        elif tag == "game_deleted":
+            operations.append(Operation("game_deleted", decode_event(tag, payload)["game_id"], -1, 0, sender, timestamp, 0, 0))
+    return operations
+
+
+def _from_parameter(entrypoint, parameter, sender, amount, timestamp):
+    """Operations of a transaction read from its parameter."""
+
+    def operation(kind, game_id, choice=-1, amount=0):
+        return Operation(kind, _int(game_id), _int(choice), amount, sender, timestamp, 0, 0)
+
+    if entrypoint == "new_game":
+        return [_new_game(parameter, timestamp)]
+    if entrypoint == "new_games":
+        return [_new_game(game, timestamp) for game in parameter]
+    if entrypoint == "new_market":
+        # The game lives in its own contract, the factory only relays its outcome
+        return [_new_game(parameter, timestamp, "new_market")]
+    if entrypoint == "bet":
+        return [operation("bet", parameter["game_id"], parameter["choice"], amount)]
+    if entrypoint == "place_bets":
+        return [operation("bet", bet["game_id"], bet["choice"], _int(bet["amount"])) for bet in parameter]
+    if entrypoint == "relay_bets":
+        # Relayed bets belong to the signer of each permit, not to the relayer
+        return [Operation("bet", _int(permit["intent"]["game_id"]), _int(permit["intent"]["choice"]), _int(permit["intent"]["amount"]),
+                          key_address(permit["key"]), timestamp, 0, 0) for permit in parameter]
+    if entrypoint == "bet_with_ticket":
+        return [operation("ticket_bet", parameter["game_id"], parameter["choice"], amount)]
+    if entrypoint == "unbet_ticket":
+        game_id, choice, opened, stake = _ticket(parameter)
+        return [Operation("ticket_unbet", game_id, choice, stake, sender, timestamp, 0, 0, opened)]
+    # redeem_ticket pays out of a settled pool, which moves none of the aggregates
+    if entrypoint == "unbet":
+        return [operation("unbet", parameter["game_id"], parameter["choice"])]
+    if entrypoint.startswith("bet_on_"):
+        return [operation("bet", parameter, LEGACY_CHOICES[entrypoint[len("bet_on_"):]], amount)]
+    if entrypoint.startswith("unbet_on_"):
+        return [operation("unbet", parameter, LEGACY_CHOICES[entrypoint[len("unbet_on_"):]])]
+    if entrypoint == "unbet_all":
+        return [operation("unbet", parameter)]
+    if entrypoint == "set_outcome":
+        return [operation("set_outcome", parameter["game_id"], parameter["choice"])]
+    if entrypoint in ("set_outcomes", "receive_results"):
+        return [operation("set_outcome", outcome["game_id"], outcome["choice"]) for outcome in parameter]
+    if entrypoint == "redeem_tez":
+        return [operation("redeem", parameter)]
+    if entrypoint == "redeem_many":
+        return [operation("redeem", game_id) for game_id in parameter]
+    return []
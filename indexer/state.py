@@ -0,0 +1,285 @@
+import json
+import zipfile
+from array import array
+
+from .feed import read_operations
+from .operations import CANCELLED, normalize
+
+MAX_OUTCOMES = CANCELLED
+ONE_DAY = 86000  # as in service_fee
+
+OPEN, SETTLED = 0, 1
+
+
+def service_fee(time_diff, amount):
+    """Fee kept in the jackpot when a position opened time_diff seconds before kickoff is removed."""
+    if time_diff >= ONE_DAY:
+        return 0
+    return (2000 - 83 * (time_diff // 3600)) * amount // 10000
+
+
+def _zeros(count):
+    return array("q", bytes(8 * count))
+
+
+class Indexer:
+    """Per-game pools and per-bettor exposure folded from the operation stream.
+
+    Games, positions and bettors are rows of flat int64 arrays; pools and stakes hold
+    MAX_OUTCOMES slots per row. The dicts only map ids and addresses to rows.
+    """
+
+    GAME_COLUMNS = ("match_time", "outcomes", "outcome", "status", "total", "jackpot", "bettors")
+    POSITION_COLUMNS = ("position_game", "position_user", "position_time")
+
+    def __init__(self):
+        self.cursor = 0  # transactions of the feed already ingested
+        self.game_rows = {}
+        self.game_positions = []
+        for column in self.GAME_COLUMNS + self.POSITION_COLUMNS:
+            setattr(self, column, array("q"))
+        self.pools = array("q")
+        self.stakes = array("q")
+        self.position_rows = {}
+        self.free_positions = []
+        self.user_ids = {}
+        self.addresses = []
+        self.exposure_by_user = array("q")
+        self.market_games = set()  # game ids held by a SoccerBetMarket, not followed by this indexer
+
+    # Rows
+
+    def _game_row(self, game_id):
+        return self.game_rows[game_id]
+
+    def _user(self, address):
+        user = self.user_ids.get(address)
+        if user is None:
+            user = self.user_ids[address] = len(self.addresses)
+            self.addresses.append(address)
+            self.exposure_by_user.append(0)
+        return user
+
+    def _open_position(self, key, row, user, timestamp):
+        if self.free_positions:
+            position = self.free_positions.pop()
+            self.position_game[position] = row
+            self.position_user[position] = user
+            self.position_time[position] = timestamp
+        else:
+            position = len(self.position_game)
+            self.position_game.append(row)
+            self.position_user.append(user)
+            self.position_time.append(timestamp)
+            self.stakes.extend(_zeros(MAX_OUTCOMES))
+        self.position_rows[key] = position
+        self.game_positions[row].add(position)
+        self.bettors[row] += 1
+        return position
+
+    def _close_position(self, key, position):
+        del self.position_rows[key]
+        self.game_positions[self.position_game[position]].discard(position)
+        self.bettors[self.position_game[position]] -= 1
+        base = position * MAX_OUTCOMES
+        self.stakes[base:base + MAX_OUTCOMES] = _zeros(MAX_OUTCOMES)
+        self.free_positions.append(position)
+
+    def _held(self, position):
+        base = position * MAX_OUTCOMES
+        return sum(self.stakes[base:base + MAX_OUTCOMES])
+
+    # Operations
+
+    def apply(self, operation):
+        getattr(self, "_" + operation.kind)(operation)
+
+    def check(self, operations):
+        """Raises ValueError if one of the operations of a transaction refers to a game or position this indexer
+        does not know, before any of them is applied, so that a transaction is applied whole or not at all."""
+        for operation in operations:
+            if operation.kind in ("new_game", "new_market"):
+                continue
+            if operation.kind in ("set_outcome", "game_deleted") and operation.game_id in self.market_games:
+                continue
+            if operation.game_id not in self.game_rows:
+                raise ValueError("unknown game %d" % operation.game_id)
+            if operation.kind == "unbet" and (operation.game_id, operation.sender) not in self.position_rows:
+                raise ValueError("no position of %s on game %d" % (operation.sender, operation.game_id))
+
+    def _new_market(self, operation):
+        self.market_games.add(operation.game_id)
+
+    def _new_game(self, operation):
+        self.market_games.discard(operation.game_id)
+        # A game id can be reused once the previous game has been swept, which drops its remaining positions
+        if operation.game_id in self.game_rows:
+            self._drop_positions(operation.game_id)
+        row = len(self.match_time)
+        self.game_rows[operation.game_id] = row
+        for column, value in zip(self.GAME_COLUMNS, (operation.match_timestamp, operation.outcomes, -1, OPEN, 0, 0, 0)):
+            getattr(self, column).append(value)
+        self.pools.extend(_zeros(MAX_OUTCOMES))
+        self.game_positions.append(set())
+
+    def _drop_positions(self, game_id):
+        for position in list(self.game_positions[self.game_rows[game_id]]):
+            self._close_position((game_id, self.addresses[self.position_user[position]]), position)
+
+    def _game_deleted(self, operation):
+        # Deleted by its market, whose game is not indexed here
+        if operation.game_id in self.market_games:
+            return
+        self._drop_positions(operation.game_id)
+        del self.game_rows[operation.game_id]
+
+    def _bet(self, operation):
+        row = self._game_row(operation.game_id)
+        user = self._user(operation.sender)
+        key = (operation.game_id, operation.sender)
+        position = self.position_rows.get(key)
+        if position is None:
+            position = self._open_position(key, row, user, operation.timestamp)
+        self.stakes[position * MAX_OUTCOMES + operation.choice] += operation.amount
+        self.pools[row * MAX_OUTCOMES + operation.choice] += operation.amount
+        self.total[row] += operation.amount
+        self.exposure_by_user[user] += operation.amount
+
+    # Ticket stakes count in the pools but belong to whoever holds the ticket, so they are left out of exposure
+
+    def _ticket_bet(self, operation):
+        row = self._game_row(operation.game_id)
+        self.pools[row * MAX_OUTCOMES + operation.choice] += operation.amount
+        self.total[row] += operation.amount
+
+    def _ticket_unbet(self, operation):
+        row = self._game_row(operation.game_id)
+        self.pools[row * MAX_OUTCOMES + operation.choice] -= operation.amount
+        self.total[row] -= operation.amount
+        self.jackpot[row] += service_fee(self.match_time[row] - operation.opened, operation.amount)
+
+    def _unbet(self, operation):
+        row = self._game_row(operation.game_id)
+        key = (operation.game_id, operation.sender)
+        position = self.position_rows[key]
+        base = position * MAX_OUTCOMES
+        choices = range(MAX_OUTCOMES) if operation.choice == -1 else (operation.choice,)
+        removed = 0
+        for choice in choices:
+            amount = self.stakes[base + choice]
+            self.stakes[base + choice] = 0
+            self.pools[row * MAX_OUTCOMES + choice] -= amount
+            removed += amount
+        self.jackpot[row] += service_fee(self.match_time[row] - self.position_time[position], removed)
+        self.total[row] -= removed
+        self.exposure_by_user[self.position_user[position]] -= removed
+        if self._held(position) == 0:
+            self._close_position(key, position)
+
+    def _set_outcome(self, operation):
+        # Relayed to a market, whose pools are not indexed here
+        if operation.game_id in self.market_games:
+            return
+        row = self._game_row(operation.game_id)
+        self.outcome[row] = operation.choice
+        self.status[row] = SETTLED
+        # Settled stakes are not at risk anymore, whatever is left to redeem
+        for position in self.game_positions[row]:
+            self.exposure_by_user[self.position_user[position]] -= self._held(position)
+
+    def _redeem(self, operation):
+        key = (operation.game_id, operation.sender)
+        position = self.position_rows.get(key)
+        if position is not None:
+            self._close_position(key, position)
+
+    # Ingestion
+
+    def ingest(self, transactions):
+        """Applies transactions of the feed, raw as read from a file or the stand-in feed. Returns their count.
+
+        The cursor moves past every transaction as soon as it is applied, so that after an error
+        ingest_file resumes at the transaction that failed instead of replaying the ones before it.
+        """
+        count = 0
+        for raw in transactions:
+            operations = normalize(raw)
+            self.check(operations)
+            for operation in operations:
+                self.apply(operation)
+            self.cursor += 1
+            count += 1
+        return count
+
+    def ingest_file(self, path):
+        """Applies the transactions of a JSON lines file that were not ingested yet."""
+        return self.ingest(read_operations(path, skip=self.cursor))
+
+    # Queries, all in constant time
+
+    def odds(self, game_id):
+        """Decimal odds of every outcome (pool including the jackpot over the stake on the outcome), None when nobody backed it."""
+        row = self._game_row(game_id)
+        pot = self.total[row] + self.jackpot[row]
+        base = row * MAX_OUTCOMES
+        return [pot / self.pools[base + choice] if self.pools[base + choice] else None for choice in range(self.outcomes[row])]
+
+    def pool(self, game_id):
+        row = self._game_row(game_id)
+        base = row * MAX_OUTCOMES
+        return dict(
+            outcome=self.outcome[row],
+            total_bet_amount=self.total[row],
+            jackpot=self.jackpot[row],
+            bettors=self.bettors[row],
+            bet_amount_on=list(self.pools[base:base + self.outcomes[row]]))
+
+    def exposure(self, address):
+        """Mutez the bettor has at stake on games without an outcome yet."""
+        user = self.user_ids.get(address)
+        return 0 if user is None else self.exposure_by_user[user]
+
+    def position(self, game_id, address):
+        position = self.position_rows.get((game_id, address))
+        if position is None:
+            return None
+        row = self.position_game[position]
+        base = position * MAX_OUTCOMES
+        return list(self.stakes[base:base + self.outcomes[row]])
+
+    # Snapshots
+
+    def snapshot(self, path):
+        """Writes the whole state to a zip file: one raw int64 member per array and the mappings as JSON."""
+        columns = self.GAME_COLUMNS + self.POSITION_COLUMNS + ("pools", "stakes", "exposure_by_user")
+        meta = dict(
+            cursor=self.cursor,
+            game_rows=sorted(self.game_rows.items()),
+            positions=[[game_id, address, position] for (game_id, address), position in self.position_rows.items()],
+            free_positions=self.free_positions,
+            addresses=self.addresses,
+            market_games=sorted(self.market_games))
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("meta.json", json.dumps(meta))
+            for column in columns:
+                archive.writestr(column + ".bin", getattr(self, column).tobytes())
+
+    @classmethod
+    def restore(cls, path):
+        indexer = cls()
+        columns = cls.GAME_COLUMNS + cls.POSITION_COLUMNS + ("pools", "stakes", "exposure_by_user")
+        with zipfile.ZipFile(path) as archive:
+            meta = json.loads(archive.read("meta.json"))
+            for column in columns:
+                getattr(indexer, column).frombytes(archive.read(column + ".bin"))
+        indexer.cursor = meta["cursor"]
+        indexer.game_rows = {game_id: row for game_id, row in meta["game_rows"]}
+        indexer.addresses = meta["addresses"]
+        indexer.user_ids = {address: user for user, address in enumerate(indexer.addresses)}
+        indexer.free_positions = meta["free_positions"]
+        indexer.market_games = set(meta.get("market_games", ()))
+        indexer.game_positions = [set() for _ in indexer.match_time]
+        for game_id, address, position in meta["positions"]:
+            indexer.position_rows[(game_id, address)] = position
+            indexer.game_positions[indexer.position_game[position]].add(position)
+        return indexer
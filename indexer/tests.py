@@ -0,0 +1,110 @@
+"""Checks of the indexer, run with
+
+    python -m unittest indexer.tests
+"""
+
+import ast
+import json
+import os
+import tempfile
+import unittest
+
+from .micheline import EVENT_FIELDS
+from .state import Indexer
+
+CONTRACT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "match_contract.py")
+
+MATCH = 1641000000
+
+
+def new_game(game_id):
+    return dict(entrypoint="new_game", parameter=dict(game_id=game_id, team_a="A", team_b="B", match_timestamp=MATCH, outcomes=3),
+                sender="admin", timestamp=MATCH - 86400 * 3)
+
+
+def bet(game_id, choice, sender, amount):
+    return dict(entrypoint="bet", parameter=dict(game_id=game_id, choice=choice), sender=sender, amount=amount, timestamp=MATCH - 86400 * 2)
+
+
+class IngestTest(unittest.TestCase):
+
+    def write(self, transactions):
+        path = os.path.join(self.directory.name, "feed.jsonl")
+        with open(path, "w") as f:
+            for transaction in transactions:
+                f.write(json.dumps(transaction) + "\n")
+        return path
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resume_after_error(self):
+        indexer = Indexer()
+        path = self.write([new_game(0), bet(0, 1, "tz1alice", 100), bet(999, 0, "tz1bob", 50)])
+        with self.assertRaises(ValueError):
+            indexer.ingest_file(path)
+        # The transactions applied before the failing one are counted, the failing one is not
+        self.assertEqual(indexer.cursor, 2)
+        self.assertEqual(indexer.position(0, "tz1alice"), [0, 100, 0])
+
+        # Once the feed is corrected, ingestion resumes at the failing transaction without replaying the others
+        path = self.write([new_game(0), bet(0, 1, "tz1alice", 100), bet(0, 0, "tz1bob", 50)])
+        self.assertEqual(indexer.ingest_file(path), 1)
+        self.assertEqual(indexer.cursor, 3)
+        self.assertEqual(indexer.position(0, "tz1alice"), [0, 100, 0])
+        self.assertEqual(indexer.pool(0)["total_bet_amount"], 150)
+        self.assertEqual(indexer.pool(0)["bettors"], 2)
+
+    def test_settle_batch_events(self):
+        indexer = Indexer()
+        indexer.ingest([new_game(0), bet(0, 1, "tz1alice", 100), bet(0, 0, "tz1bob", 50), bet(0, 2, "tz1carol", 20)])
+        indexer.ingest([dict(entrypoint="set_outcome", parameter=dict(game_id=0, choice=1), sender="admin", timestamp=MATCH + 7200)])
+        settle = dict(entrypoint="settle_batch", parameter=dict(game_id=0, max_count=2), sender="admin", timestamp=MATCH + 7300, events=[
+            dict(tag="redeem", payload=dict(game_id="0", bettor="tz1alice", amount="170")),
+            dict(tag="prune", payload={"prim": "Pair", "args": [{"int": "0"}, {"string": "tz1bob"}]})])
+        indexer.ingest([settle])
+        self.assertIsNone(indexer.position(0, "tz1alice"))
+        self.assertIsNone(indexer.position(0, "tz1bob"))
+        self.assertEqual(indexer.pool(0)["bettors"], 1)
+
+        # sweep drops the last losing position, then the game
+        sweep = dict(entrypoint="sweep", parameter=10, sender="tz1keeper", timestamp=MATCH + 200 * 86400, events=[
+            dict(tag="prune", payload=dict(game_id="0", bettor="tz1carol")),
+            dict(tag="game_deleted", payload=dict(game_id="0", remainder="0"))])
+        indexer.ingest([sweep])
+        self.assertIsNone(indexer.position(0, "tz1carol"))
+        self.assertNotIn(0, indexer.game_rows)
+
+        # The id can be used again afterwards
+        indexer.ingest([new_game(0), bet(0, 0, "tz1bob", 10)])
+        self.assertEqual(indexer.pool(0)["bettors"], 1)
+
+
+def _flatten(layout):
+    if isinstance(layout, str):
+        return (layout,)
+    return sum((_flatten(item) for item in layout), ())
+
+
+class EventTest(unittest.TestCase):
+
+    def test_fields_match_contract(self):
+        # The contract only runs under SmartPy, so its EVENT_TYPES assignment is read from the source
+        with open(CONTRACT) as f:
+            source = f.read()
+        start = source.index("EVENT_TYPES = {")
+        block = ast.parse(source[start:source.index("\n}\n", start) + 2])
+        layouts = {}
+        for key, value in zip(block.body[0].value.keys, block.body[0].value.values):
+            self.assertEqual(value.func.attr, "layout")
+            fields = ast.literal_eval(value.args[0])
+            self.assertEqual(set(_flatten(fields)), {keyword.arg for keyword in value.func.value.keywords})
+            layouts[key.value] = _flatten(fields)
+        self.assertEqual(layouts, EVENT_FIELDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,270 +1,1014 @@
 import smartpy as sp
 
 
+# Stakes of a bettor keyed by outcome, only outcomes actually backed being present
+BET_TYPE = sp.TRecord(timestamp=sp.TTimestamp, stakes=sp.TMap(sp.TInt, sp.TMutez))
+
+# Outcome set by the admin when a game is cancelled or postponed, every bettor getting refunded
+CANCELLED = 10
+
+# Content of the tickets handed out in ticket mode, the ticket amount being the stake in mutez
+RECEIPT_TYPE = sp.TRecord(game_id=sp.TInt, choice=sp.TInt, timestamp=sp.TTimestamp)
+
+# Bet signed off-chain by a bettor and relayed by anyone through relay_bets, the stake being drawn from the
+# bettor's prepaid balance. The nonce must be the next one of the bettor, which makes every intent usable once.
+INTENT_TYPE = sp.TRecord(game_id=sp.TInt, choice=sp.TInt, amount=sp.TMutez, nonce=sp.TNat, expiry=sp.TTimestamp)
+
+# The signature covers sp.pack(sp.pair(chain id, sp.pair(factory address, intent))), so that an intent cannot be replayed
+# on another contract, nor on the same contract deployed on another chain
+PERMIT_TYPE = sp.TRecord(key=sp.TKey, signature=sp.TSignature, intent=INTENT_TYPE)
+
+# Result of a game as posted by the admin or pushed by the oracle, choice being CANCELLED for a cancelled game
+RESULT_TYPE = sp.TRecord(game_id=sp.TInt, choice=sp.TInt)
+
+# Payloads of the events emitted by the factory and the markets, laid out as right combs in declaration order so that
+# off-chain consumers (indexer.micheline.decode_event) can read them by position
+EVENT_TYPES = {
+    "bet": sp.TRecord(game_id=sp.TInt, bettor=sp.TAddress, choice=sp.TInt, amount=sp.TMutez).layout(
+        ("game_id", ("bettor", ("choice", "amount")))),
+    "unbet": sp.TRecord(game_id=sp.TInt, bettor=sp.TAddress, choice=sp.TInt, amount=sp.TMutez, fee=sp.TMutez).layout(
+        ("game_id", ("bettor", ("choice", ("amount", "fee"))))),
+    "redeem": sp.TRecord(game_id=sp.TInt, bettor=sp.TAddress, amount=sp.TMutez).layout(
+        ("game_id", ("bettor", "amount"))),
+    "outcome": sp.TRecord(game_id=sp.TInt, outcome=sp.TInt).layout(
+        ("game_id", "outcome")),
+    "settlement": sp.TRecord(game_id=sp.TInt, outcome=sp.TInt, refund=sp.TBool, pool=sp.TMutez, winning_pool=sp.TMutez).layout(
+        ("game_id", ("outcome", ("refund", ("pool", "winning_pool"))))),
+    "game_deleted": sp.TRecord(game_id=sp.TInt, remainder=sp.TMutez).layout(
+        ("game_id", "remainder")),
+    # Losing position dropped by settle_batch or sweep, which pays nothing
+    "prune": sp.TRecord(game_id=sp.TInt, bettor=sp.TAddress).layout(
+        ("game_id", "bettor"))
+}
+
+# Time given to winners to redeem once the outcome is set, after which sweep reclaims what is left
+CLAIM_PERIOD_DAYS = 180
+
+GAME_TYPE = sp.TRecord(
+    team_a=sp.TString,
+    team_b=sp.TString,
+    status=sp.TInt,
+    match_timestamp=sp.TTimestamp,
+    outcomes=sp.TInt,
+    outcome=sp.TInt,
+    total_bet_amount=sp.TMutez,
+    bet_amount_on=sp.TMap(sp.TInt, sp.TMutez),
+    redeemed=sp.TInt,
+    bets_by_choice=sp.TMap(sp.TInt, sp.TInt),
+    bettors=sp.TInt,
+    ticket_stake_on=sp.TMap(sp.TInt, sp.TMutez),
+    positions_opened=sp.TNat,
+    settle_cursor=sp.TNat,
+    jackpot=sp.TMutez,
+    settlement=sp.TRecord(
+        refund=sp.TBool,
+        winning_pool=sp.TMutez,
+        numerator=sp.TNat,
+        denominator=sp.TNat,
+        unpaid=sp.TMutez,
+        to_pay=sp.TInt,
+        ticket_stake=sp.TMutez
+    )
+)
+
+
+# Settlement summary kept once a game has an outcome, the live record being deleted when all winners are paid
+ARCHIVE_TYPE = sp.TRecord(
+    outcome=sp.TInt,
+    total_bet_amount=sp.TMutez,
+    bet_amount_on=sp.TMap(sp.TInt, sp.TMutez),
+    jackpot=sp.TMutez,
+    redeemed=sp.TInt,
+    payout_ratio=sp.TRecord(numerator=sp.TNat, denominator=sp.TNat),
+    positions=sp.TNat,
+    claim_deadline=sp.TTimestamp
+)
+
+
+def new_game_record(params):
+    return sp.record(
+        team_a=params.team_a,
+        team_b=params.team_b,
+        status=sp.int(0),
+        match_timestamp = params.match_timestamp,
+        outcomes=params.outcomes,
+        outcome=sp.int(-1),
+        total_bet_amount=sp.tez(0),
+        bet_amount_on=sp.map(tkey=sp.TInt, tvalue=sp.TMutez),
+        redeemed=sp.int(0),
+        bets_by_choice=sp.map(tkey=sp.TInt, tvalue=sp.TInt),
+        bettors=sp.int(0),
+        ticket_stake_on=sp.map(tkey=sp.TInt, tvalue=sp.TMutez),
+        positions_opened=sp.nat(0),
+        settle_cursor=sp.nat(0),
+        jackpot=sp.tez(0),
+        settlement=sp.record(
+            refund=False,
+            winning_pool=sp.tez(0),
+            numerator=sp.nat(0),
+            denominator=sp.nat(1),
+            unpaid=sp.tez(0),
+            to_pay=sp.int(0),
+            ticket_stake=sp.tez(0)
+        )
+    )
+
+
+# Bets removed less than a day before kickoff pay a fee to the game jackpot, from 20% down to 0.91% of the amount.
+# Shared by the service_fee lambda, the unbet_fee view (which cannot call the lambda) and SoccerBetMarket.
+def compute_service_fee(params):
+    one_day = sp.int(86000)
+    service_fee = sp.local("service_fee", sp.tez(0))
+    time_diff = sp.local("time_diff", params.match_timestamp - params.bet_timestamp)
+    sp.if time_diff.value < one_day:
+        hours = sp.fst(sp.ediv(time_diff.value,3600).open_some())
+        service_fee.value = sp.split_tokens(sp.mul(sp.as_nat(2000-sp.mul(83,hours)), params.amount), 1, 10000)
+    return service_fee.value
+
+
+# Emits payload under tag, typed against EVENT_TYPES so that an emit cannot drift from the published layout
+def emit_event(tag, payload):
+    sp.emit(sp.set_type_expr(payload, EVENT_TYPES[tag]), tag=tag, with_type=True)
+
+
+# Settlement frozen when the outcome of a game is set, so that every redemption pays stake * numerator / denominator
+def settlement_of(game, winning_pool, to_pay, ticket_stake, refund):
+    return sp.record(
+        refund=refund,
+        winning_pool=winning_pool,
+        numerator=sp.utils.mutez_to_nat(game.total_bet_amount + game.jackpot),
+        denominator=sp.utils.mutez_to_nat(winning_pool),
+        unpaid=game.total_bet_amount + game.jackpot,
+        to_pay=to_pay,
+        ticket_stake=ticket_stake
+    )
+
+
 class SoccerBetFactory(sp.Contract):
     def __init__(self, admin):
+        self.market = SoccerBetMarket()
         self.init(
             admin=admin,
-            games=sp.map(tkey=sp.TInt),
-            archived_games = sp.map(tkey = sp.TInt),
+            # Contract allowed to push results through receive_results, the admin until set_oracle is called
+            oracle=admin,
+            games=sp.big_map(tkey=sp.TInt, tvalue=GAME_TYPE),
+            # Games originated as their own SoccerBetMarket contract, until the market hands back its remainder
+            markets=sp.big_map(tkey=sp.TInt, tvalue=sp.TAddress),
+            # Positions are keyed by (game_id, bettor) so that a call only loads the bettor it touches
+            bet_amount_by_user=sp.big_map(tkey=sp.TPair(sp.TInt, sp.TAddress), tvalue=BET_TYPE),
+            # Bettors of a game in order of arrival, walked by settle_batch
+            bettor_index=sp.big_map(tkey=sp.TPair(sp.TInt, sp.TNat), tvalue=sp.TAddress),
+            # Games in which each bettor holds a position, so that a wallet only reads its own entry
+            games_by_user=sp.big_map(tkey=sp.TAddress, tvalue=sp.TSet(sp.TInt)),
+            # Prepaid balances funding the bets relayed with relay_bets, and the next permit nonce of each bettor
+            balances=sp.big_map(tkey=sp.TAddress, tvalue=sp.TMutez),
+            nonces=sp.big_map(tkey=sp.TAddress, tvalue=sp.TNat),
+            archived_games = sp.big_map(tkey = sp.TInt, tvalue=ARCHIVE_TYPE),
+            # Settled games in order of claim deadline, swept from sweep_head; sweep_cursor walks the bettors of the head game
+            sweep_queue=sp.big_map(tkey=sp.TNat, tvalue=sp.TInt),
+            sweep_head=sp.nat(0),
+            sweep_tail=sp.nat(0),
+            sweep_cursor=sp.nat(0),
+            # Games deleted without bets, with the number of bettor slots left to clear; sweep clears them first,
+            # from emptied_head, without waiting for any deadline
+            emptied_games=sp.big_map(tkey=sp.TInt, tvalue=sp.TNat),
+            emptied_queue=sp.big_map(tkey=sp.TNat, tvalue=sp.TInt),
+            emptied_head=sp.nat(0),
+            emptied_tail=sp.nat(0),
             remainder=sp.tez(0)
         )
 
     @sp.entry_point
     def new_game(self, params):
         sp.verify_equal(sp.sender, self.data.admin,message="Error: you cannot initialize a new game")
-        sp.verify(~ self.data.games.contains(params.game_id),message="Error: this game id already exists")
-
-        self.data.games[params.game_id] = sp.record(
-            team_a=params.team_a,
-            team_b=params.team_b,
-            status=sp.int(0),
-            match_timestamp = params.match_timestamp,
-            outcome=sp.int(-1),
-            total_bet_amount=sp.tez(0),
-            bet_amount_on=sp.record(team_a=sp.tez(0), team_b=sp.tez(0), tie=sp.tez(0)),
-            redeemed=sp.int(0),
-            bets_by_choice=sp.record(team_a=sp.int(0), team_b=sp.int(0), tie=sp.int(0)),
-            bet_amount_by_user=sp.map(tkey=sp.TAddress, tvalue=sp.TRecord(timestamp=sp.TTimestamp,team_a=sp.TMutez,team_b=sp.TMutez, tie=sp.TMutez)),
-            jackpot=sp.tez(0)
-        )
+        self.create_game(params)
 
+    # Loads a whole set of fixtures in a single operation
     @sp.entry_point
-    def bet_on_team_a(self, game_id):
-        self.add_bet(sp.record(game_id=game_id, choice=sp.int(0)))
+    def new_games(self, games):
+        sp.set_type(games, sp.TList(sp.TRecord(game_id=sp.TInt, team_a=sp.TString, team_b=sp.TString, match_timestamp=sp.TTimestamp, outcomes=sp.TInt)))
+        sp.verify_equal(sp.sender, self.data.admin,message="Error: you cannot initialize a new game")
+        sp.for params in games:
+            self.create_game(params)
 
-    @sp.entry_point
-    def bet_on_team_b(self, game_id):
-        self.add_bet(sp.record(game_id=game_id, choice=sp.int(1)))
+    @sp.private_lambda(with_storage="read-write", with_operations=False, wrap_call=True)
+    def create_game(self, params):
+        self.verify_new_game(params)
+        self.data.games[params.game_id] = new_game_record(params)
 
+    def verify_new_game(self, params):
+        sp.verify(~ self.data.games.contains(params.game_id),message="Error: this game id already exists")
+        sp.verify(~ self.data.markets.contains(params.game_id),message="Error: this game id already exists")
+        # The positions of a settled game are only all gone once it has been swept
+        sp.verify(~ self.data.archived_games.contains(params.game_id),message="Error: this game id already exists")
+        sp.verify(~ self.data.emptied_games.contains(params.game_id),message="Error: this game id already exists")
+        # Outcomes are numbered from 0 (team_a, team_b and tie for a regular match), CANCELLED being reserved
+        sp.verify((params.outcomes >= 2) & (params.outcomes <= CANCELLED), message="Error: a game must have between 2 and 10 outcomes")
+
+    # Originates a SoccerBetMarket holding the pools, positions and jackpot of a single game, so that its
+    # bettors do not share storage with any other game. The factory keeps the outcome authority.
+    @sp.entry_point
+    def new_market(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, team_a=sp.TString, team_b=sp.TString, match_timestamp=sp.TTimestamp, outcomes=sp.TInt))
+        sp.verify_equal(sp.sender, self.data.admin,message="Error: you cannot initialize a new game")
+        self.verify_new_game(params)
+        self.data.markets[params.game_id] = sp.create_contract(contract=self.market, storage=sp.record(
+            factory=sp.self_address,
+            admin=self.data.admin,
+            game_id=params.game_id,
+            game=new_game_record(params),
+            bet_amount_by_user=sp.big_map(tkey=sp.TAddress, tvalue=BET_TYPE),
+            bettor_index=sp.big_map(tkey=sp.TNat, tvalue=sp.TAddress),
+            closed=False))
+
+    # Called by a market once all its winners are paid, with whatever is left (jackpot of an empty game, rounding leftovers)
     @sp.entry_point
-    def bet_on_tie(self, game_id):
-        self.add_bet(sp.record(game_id=game_id, choice=sp.int(2)))
+    def collect_remainder(self, game_id):
+        sp.set_type(game_id, sp.TInt)
+        sp.verify(self.data.markets.contains(game_id), message="Error: this match does not exist")
+        sp.verify(self.data.markets[game_id] == sp.sender, message="Error: only the market of this game can close it")
+        self.data.remainder += sp.amount
+        del self.data.markets[game_id]
 
-    @sp.private_lambda(with_storage="read-write", with_operations=False, wrap_call=True)
-    def add_bet(self, params):
-        sp.verify(self.data.games.contains(params.game_id))
-        game = self.data.games[params.game_id]
-        sp.verify(sp.now < game.match_timestamp,message = "Error, you cannot place a bet anymore") 
-        bet_by_user=game.bet_amount_by_user[sp.sender]
+    @sp.entry_point
+    def bet(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, choice=sp.TInt))
+        self.add_bet(sp.record(game_id=params.game_id, choice=params.choice, amount=sp.amount, bettor=sp.sender))
 
-        sp.if ~game.bet_amount_by_user.contains(sp.sender):
-            game.bet_amount_by_user[sp.sender] = sp.record(
-                timestamp=sp.now,
-                team_a=sp.tez(0),
-                team_b=sp.tez(0),
-                tie=sp.tez(0))
-        
-        sp.if params.choice == 0:
-            bet_by_user.team_a += sp.amount
-            game.bet_amount_on.team_a += sp.amount
-            game.bets_by_choice.team_a += sp.int(1)
-
-        sp.if params.choice == 1:
-            bet_by_user.team_b += sp.amount
-            game.bet_amount_on.team_b += sp.amount
-            game.bets_by_choice.team_b += sp.int(1)
-
-        sp.if params.choice == 2:
-            bet_by_user.tie += sp.amount
-            game.bet_amount_on.tie += sp.amount
-            game.bets_by_choice.tie += sp.int(1)
-        
-        game.total_bet_amount = game.bet_amount_on.team_a + game.bet_amount_on.team_b + game.bet_amount_on.tie
+    # Places several bets, possibly on different games and outcomes, in a single operation.
+    # Each game and position touched is read once into the local maps below and written back once.
+    @sp.entry_point
+    def place_bets(self, bets):
+        sp.set_type(bets, sp.TList(sp.TRecord(game_id=sp.TInt, choice=sp.TInt, amount=sp.TMutez)))
+        total_amount = sp.local("total_amount", sp.tez(0))
+        games = sp.local("games", sp.map(tkey=sp.TInt, tvalue=GAME_TYPE))
+        # Positions of the sender, keyed by game
+        positions = sp.local("positions", sp.map(tkey=sp.TInt, tvalue=BET_TYPE))
+        sp.for bet in bets:
+            total_amount.value += bet.amount
+            sp.if ~games.value.contains(bet.game_id):
+                sp.verify(self.data.games.contains(bet.game_id), message="Error: this match does not exist")
+                games.value[bet.game_id] = self.data.games[bet.game_id]
+                positions.value[bet.game_id] = self.data.bet_amount_by_user.get(sp.pair(bet.game_id, sp.sender), default_value = sp.record(
+                    timestamp=sp.now,
+                    stakes=sp.map(tkey=sp.TInt, tvalue=sp.TMutez)))
+            self.stake_bet(games.value[bet.game_id], positions.value[bet.game_id],
+                sp.record(game_id=bet.game_id, choice=bet.choice, amount=bet.amount, bettor=sp.sender))
+        sp.verify(total_amount.value == sp.amount, message = "Error: the amount sent does not match the sum of the bets")
+        sp.for game in games.value.items():
+            self.data.games[game.key] = game.value
+            self.data.bet_amount_by_user[sp.pair(game.key, sp.sender)] = positions.value[game.key]
 
     @sp.entry_point
-    def unbet_on_team_a(self, game_id):
-        self.remove_bet(sp.record(game_id=game_id, choice=sp.int(0)))
+    def deposit(self):
+        sp.verify(sp.amount > sp.tez(0), message = "Error: a deposit must carry a positive amount")
+        self.data.balances[sp.sender] = self.data.balances.get(sp.sender, default_value = sp.tez(0)) + sp.amount
 
     @sp.entry_point
-    def unbet_on_team_b(self, game_id):
-        self.remove_bet(sp.record(game_id=game_id, choice=sp.int(1)))
+    def withdraw(self, amount):
+        sp.set_type(amount, sp.TMutez)
+        balance = sp.local("balance", self.data.balances.get(sp.sender, default_value = sp.tez(0))).value
+        sp.verify(amount <= balance, message = "Error: your balance is too low")
+        sp.if balance == amount:
+            del self.data.balances[sp.sender]
+        sp.else:
+            self.data.balances[sp.sender] = balance - amount
+        sp.send(sp.sender, amount)
 
+    # Places bets signed off-chain, so that an operator can submit the bets of many bettors in a single operation.
+    # Anyone can relay: the signature, nonce and expiry of every intent are checked, and the whole batch fails if one is not valid.
+    # A single stale or underfunded permit thus reverts the others, so relayers must simulate a batch before injecting it and
+    # leave out the permits that fail on their own.
     @sp.entry_point
-    def unbet_on_tie(self, game_id):
-        self.remove_bet(sp.record(game_id=game_id, choice=sp.int(2)))
+    def relay_bets(self, permits):
+        sp.set_type(permits, sp.TList(PERMIT_TYPE))
+        sp.verify(sp.amount == sp.tez(0), message = "Error: relayed bets are paid from the prepaid balances")
+        sp.for permit in permits:
+            intent = permit.intent
+            bettor = sp.local("bettor", sp.to_address(sp.implicit_account(sp.hash_key(permit.key)))).value
+            sp.verify(sp.check_signature(permit.key, permit.signature, sp.pack(sp.pair(sp.chain_id, sp.pair(sp.self_address, intent)))), message = "Error: invalid signature")
+            sp.verify(sp.now <= intent.expiry, message = "Error: this bet intent has expired")
+            sp.verify(intent.nonce == self.data.nonces.get(bettor, default_value = sp.nat(0)), message = "Error: invalid nonce")
+            self.data.nonces[bettor] = intent.nonce + 1
+            balance = sp.local("balance", self.data.balances.get(bettor, default_value = sp.tez(0))).value
+            sp.verify(intent.amount <= balance, message = "Error: the balance of the bettor is too low")
+            sp.if balance == intent.amount:
+                del self.data.balances[bettor]
+            sp.else:
+                self.data.balances[bettor] = balance - intent.amount
+            self.add_bet(sp.record(game_id=intent.game_id, choice=intent.choice, amount=intent.amount, bettor=bettor))
 
+    @sp.private_lambda(with_storage="read-write", with_operations=True, wrap_call=True)
+    def add_bet(self, params):
+        sp.verify(self.data.games.contains(params.game_id))
+        # Work on local copies so that each big_map entry is read and written back only once
+        game = sp.local("game", self.data.games[params.game_id]).value
+        bet_key = sp.pair(params.game_id, params.bettor)
+        bet_by_user = sp.local("bet_by_user", self.data.bet_amount_by_user.get(bet_key, default_value = sp.record(
+                timestamp=sp.now,
+                stakes=sp.map(tkey=sp.TInt, tvalue=sp.TMutez)))).value
+        self.stake_bet(game, bet_by_user, params)
+        self.data.bet_amount_by_user[bet_key] = bet_by_user
+        self.data.games[params.game_id] = game
+
+    # Adds a bet to a game and a position already read from storage, which the caller writes back
+    def stake_bet(self, game, bet_by_user, params):
+        sp.verify(sp.now < game.match_timestamp,message = "Error, you cannot place a bet anymore") 
+        sp.verify(game.outcome == -1, message = "Error, you cannot place a bet anymore")
+        sp.verify(params.amount > sp.tez(0), message = "Error: a bet must carry a positive amount")
+        sp.verify((params.choice >= 0) & (params.choice < game.outcomes), message = "Error: this outcome does not exist")
+
+        sp.if sp.len(bet_by_user.stakes) == 0:
+            game.bettors += sp.int(1)
+            self.data.bettor_index[sp.pair(params.game_id, game.positions_opened)] = params.bettor
+            game.positions_opened += 1
+            self.open_position(params.bettor, params.game_id)
+
+        # bets_by_choice counts the bettors backing an outcome, not the number of bets placed on it
+        sp.if ~bet_by_user.stakes.contains(params.choice):
+            game.bets_by_choice[params.choice] = game.bets_by_choice.get(params.choice, default_value = sp.int(0)) + 1
+        bet_by_user.stakes[params.choice] = bet_by_user.stakes.get(params.choice, default_value = sp.tez(0)) + params.amount
+        game.bet_amount_on[params.choice] = game.bet_amount_on.get(params.choice, default_value = sp.tez(0)) + params.amount
+        game.total_bet_amount += params.amount
+        emit_event("bet", sp.record(game_id=params.game_id, bettor=params.bettor, choice=params.choice, amount=params.amount))
+
+    # Removes the bets on one outcome, or on every outcome when choice is -1
     @sp.entry_point
-    def unbet_all(self, game_id):
-        self.remove_bet(sp.record(game_id=game_id, choice=sp.int(-1)))
+    def unbet(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, choice=sp.TInt))
+        self.remove_bet(params)
 
     @sp.private_lambda(with_storage="read-write", with_operations=True, wrap_call=True)
     def remove_bet(self, params):
         sp.verify(self.data.games.contains(params.game_id),message="Error: this match does not exist")
-        game = self.data.games[params.game_id]
-        sp.verify(game.bet_amount_by_user.contains(sp.sender),message="Error: you do not have any bets to remove")
+        bet_key = sp.pair(params.game_id, sp.sender)
+        sp.verify(self.data.bet_amount_by_user.contains(bet_key),message="Error: you do not have any bets to remove")
+        game = sp.local("game", self.data.games[params.game_id]).value
         sp.verify(sp.now < game.match_timestamp, message = "Error, you cannot remove a bet anymore")
+        sp.verify(game.outcome == -1, message = "Error, you cannot remove a bet anymore")
         amount_to_send = sp.local("amount_to_send", sp.tez(0))
-        bet_by_user = game.bet_amount_by_user[sp.sender]
-
-        one_day = sp.int(86000)
-        service_fee = sp.local("service_fee", sp.tez(0))
-        fee_multiplier = sp.local("fee_multiplier", sp.nat(0))
-        time_diff = sp.local("time_diff", sp.int(0))
-
-        time_diff.value = self.data.games[params.game_id].match_timestamp - bet_by_user.timestamp
-        sp.if time_diff.value < one_day:  
-            time_diff.value = sp.fst(sp.ediv(time_diff.value,3600).open_some())
-            fee_multiplier.value = sp.as_nat(2000-sp.mul(83,time_diff.value))
-            
-        sp.if params.choice == 0:
-            sp.verify(bet_by_user.team_a > sp.tez(0), message="Error: you have not placed any bets on this outcome")
-            game.bet_amount_on.team_a -= bet_by_user.team_a
-            amount_to_send.value = bet_by_user.team_a
-            self.data.games[params.game_id].bets_by_choice.team_a -= sp.int(1)
-            service_fee.value = sp.mul(fee_multiplier.value, bet_by_user.team_a)
-            bet_by_user.team_a = sp.tez(0)
-
-        sp.if params.choice == 1:
-            sp.verify(bet_by_user.team_b > sp.tez(0), message="Error: you have not placed any bets on this outcome")
-            game.bet_amount_on.team_b -= bet_by_user.team_b
-            amount_to_send.value = bet_by_user.team_b
-            self.data.games[params.game_id].bets_by_choice.team_b -= sp.int(1)
-            service_fee.value = sp.mul(fee_multiplier.value, bet_by_user.team_b)
-            bet_by_user.team_b = sp.tez(0)
-
-        sp.if params.choice == 2:
-            sp.verify(bet_by_user.tie > sp.tez(0), message="Error: you have not placed any bets on this outcome")
-            game.bet_amount_on.tie -= bet_by_user.tie
-            amount_to_send.value = bet_by_user.tie
-            self.data.games[params.game_id].bets_by_choice.tie -= sp.int(1)
-            service_fee.value = sp.mul(fee_multiplier.value, bet_by_user.tie)
-            bet_by_user.tie = sp.tez(0)
+        bet_by_user = sp.local("bet_by_user", self.data.bet_amount_by_user[bet_key]).value
 
         sp.if params.choice == -1:
-            sp.if bet_by_user.team_a>sp.tez(0):
-                game.bet_amount_on.team_a -= bet_by_user.team_a
-                amount_to_send.value = bet_by_user.team_a
-                self.data.games[params.game_id].bets_by_choice.team_a -= sp.int(1)            
-            sp.if bet_by_user.team_b>sp.tez(0):
-                game.bet_amount_on.team_b -= bet_by_user.team_b
-                amount_to_send.value += bet_by_user.team_b
-                self.data.games[params.game_id].bets_by_choice.team_b -= sp.int(1)
-            sp.if bet_by_user.tie>sp.tez(0):
-                game.bet_amount_on.tie -= bet_by_user.tie
-                amount_to_send.value += bet_by_user.tie
-                self.data.games[params.game_id].bets_by_choice.tie -= sp.int(1)
-
-            service_fee.value = sp.mul(fee_multiplier.value, bet_by_user.team_a+bet_by_user.team_b+bet_by_user.tie)
-            bet_by_user.team_a = sp.tez(0)
-            bet_by_user.team_b = sp.tez(0)
-            bet_by_user.tie = sp.tez(0)
-
-        sp.if time_diff.value < one_day:  
-            service_fee.value = sp.split_tokens(service_fee.value, 1, 10000)
-            game.jackpot+=service_fee.value
-
-        sp.send(sp.sender, amount_to_send.value - service_fee.value)
-        game.total_bet_amount = game.bet_amount_on.team_a + game.bet_amount_on.team_b + game.bet_amount_on.tie
-
-        sp.if (bet_by_user.team_a == sp.mutez(0)) & (bet_by_user.team_b == sp.tez(0)) & (bet_by_user.tie == sp.tez(0)):
-            del game.bet_amount_by_user[sp.sender]
+            sp.for stake in bet_by_user.stakes.items():
+                game.bet_amount_on[stake.key] -= stake.value
+                game.bets_by_choice[stake.key] -= sp.int(1)
+                amount_to_send.value += stake.value
+            bet_by_user.stakes = sp.map(tkey=sp.TInt, tvalue=sp.TMutez)
+        sp.else:
+            sp.verify(bet_by_user.stakes.contains(params.choice), message="Error: you have not placed any bets on this outcome")
+            amount_to_send.value = bet_by_user.stakes[params.choice]
+            game.bet_amount_on[params.choice] -= amount_to_send.value
+            game.bets_by_choice[params.choice] -= sp.int(1)
+            del bet_by_user.stakes[params.choice]
+
+        service_fee = sp.local("service_fee", self.service_fee(sp.record(
+            match_timestamp=game.match_timestamp,
+            bet_timestamp=bet_by_user.timestamp,
+            amount=amount_to_send.value))).value
+        game.jackpot+=service_fee
+        emit_event("unbet", sp.record(game_id=params.game_id, bettor=sp.sender, choice=params.choice, amount=amount_to_send.value, fee=service_fee))
+
+        sp.send(sp.sender, amount_to_send.value - service_fee)
+        game.total_bet_amount -= amount_to_send.value
+
+        sp.if sp.len(bet_by_user.stakes) == 0:
+            del self.data.bet_amount_by_user[bet_key]
+            self.close_position(sp.sender, params.game_id)
+            game.bettors -= sp.int(1)
+        sp.else:
+            self.data.bet_amount_by_user[bet_key] = bet_by_user
+        self.data.games[params.game_id] = game
 
-    @sp.private_lambda(with_storage="read-write", with_operations=False, wrap_call=True)
+    def open_position(self, bettor, game_id):
+        sp.if ~self.data.games_by_user.contains(bettor):
+            self.data.games_by_user[bettor] = sp.set(t=sp.TInt)
+        self.data.games_by_user[bettor].add(game_id)
+
+    def close_position(self, bettor, game_id):
+        self.data.games_by_user[bettor].remove(game_id)
+        sp.if sp.len(self.data.games_by_user[bettor]) == 0:
+            del self.data.games_by_user[bettor]
+
+    @sp.private_lambda(with_storage=None, with_operations=False, wrap_call=True)
+    def service_fee(self, params):
+        sp.result(compute_service_fee(params))
+
+    # Ticket mode: the position is handed to the bettor as a ticket instead of being stored in bet_amount_by_user,
+    # the ticket amount being the stake in mutez. Payouts and refunds go to whoever sends the ticket back.
+    @sp.entry_point
+    def bet_with_ticket(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, choice=sp.TInt, receiver=sp.TContract(sp.TTicket(RECEIPT_TYPE))))
+        sp.verify(self.data.games.contains(params.game_id), message="Error: this match does not exist")
+        game = sp.local("game", self.data.games[params.game_id]).value
+        sp.verify(sp.now < game.match_timestamp,message = "Error, you cannot place a bet anymore")
+        sp.verify(game.outcome == -1, message = "Error, you cannot place a bet anymore")
+        sp.verify(sp.amount > sp.tez(0), message = "Error: a bet must carry a positive amount")
+        sp.verify((params.choice >= 0) & (params.choice < game.outcomes), message = "Error: this outcome does not exist")
+
+        game.bet_amount_on[params.choice] = game.bet_amount_on.get(params.choice, default_value = sp.tez(0)) + sp.amount
+        game.ticket_stake_on[params.choice] = game.ticket_stake_on.get(params.choice, default_value = sp.tez(0)) + sp.amount
+        game.total_bet_amount += sp.amount
+        self.data.games[params.game_id] = game
+        emit_event("bet", sp.record(game_id=params.game_id, bettor=sp.sender, choice=params.choice, amount=sp.amount))
+        receipt = sp.ticket(sp.record(game_id=params.game_id, choice=params.choice, timestamp=sp.now), sp.utils.mutez_to_nat(sp.amount))
+        sp.transfer(receipt, sp.tez(0), params.receiver)
+
+    @sp.entry_point
+    def unbet_ticket(self, receipt):
+        sp.set_type(receipt, sp.TTicket(RECEIPT_TYPE))
+        ticket_data, copy = sp.match_tuple(sp.read_ticket_raw(receipt), "ticket_data", "copy")
+        ticketer, bet, stake = sp.match_tuple(ticket_data, "ticketer", "bet", "stake")
+        sp.verify(ticketer == sp.self_address, message="Error: this ticket was not issued by this contract")
+        sp.verify(self.data.games.contains(bet.game_id), message="Error: this match does not exist")
+        game = sp.local("game", self.data.games[bet.game_id]).value
+        sp.verify(sp.now < game.match_timestamp, message = "Error, you cannot remove a bet anymore")
+        sp.verify(game.outcome == -1, message = "Error, you cannot remove a bet anymore")
+        amount = sp.utils.nat_to_mutez(stake)
+
+        game.bet_amount_on[bet.choice] -= amount
+        game.ticket_stake_on[bet.choice] -= amount
+
+        service_fee = sp.local("service_fee", self.service_fee(sp.record(
+            match_timestamp=game.match_timestamp,
+            bet_timestamp=bet.timestamp,
+            amount=amount))).value
+        game.jackpot+=service_fee
+        game.total_bet_amount -= amount
+        self.data.games[bet.game_id] = game
+        emit_event("unbet", sp.record(game_id=bet.game_id, bettor=sp.sender, choice=bet.choice, amount=amount, fee=service_fee))
+        sp.send(sp.sender, amount - service_fee)
+
+    @sp.entry_point
+    def redeem_ticket(self, receipt):
+        sp.set_type(receipt, sp.TTicket(RECEIPT_TYPE))
+        ticket_data, copy = sp.match_tuple(sp.read_ticket_raw(receipt), "ticket_data", "copy")
+        ticketer, bet, stake = sp.match_tuple(ticket_data, "ticketer", "bet", "stake")
+        sp.verify(ticketer == sp.self_address, message="Error: this ticket was not issued by this contract")
+        sp.verify(self.data.games.contains(bet.game_id),message="Error: this match does not exist anymore!")
+        game = sp.local("game", self.data.games[bet.game_id]).value
+        sp.verify(game.outcome != -1, message = "Error, you cannot redeem your winnings yet")
+        sp.verify(game.settlement.refund | (bet.choice == game.outcome), message="Error: you have lost your bet! :(")
+
+        amount = sp.utils.nat_to_mutez(stake)
+        amount_to_send = sp.local("amount_to_send", sp.split_tokens(amount, game.settlement.numerator, game.settlement.denominator)).value
+        game.settlement.unpaid -= amount_to_send
+        game.settlement.ticket_stake -= amount
+        game.redeemed += 1
+        self.data.games[bet.game_id] = game
+        emit_event("redeem", sp.record(game_id=bet.game_id, bettor=sp.sender, amount=amount_to_send))
+
+        sp.if (game.settlement.to_pay == 0) & (game.settlement.ticket_stake == sp.tez(0)):
+            self.delete_game(bet.game_id)
+
+        sp.send(sp.sender, amount_to_send)
+
+    @sp.private_lambda(with_storage="read-write", with_operations=True, wrap_call=True)
     def archive_game(self, params):
         sp.verify(self.data.games.contains(params.game_id), message = "Error: this match does not exist")
-        game = self.data.games[params.game_id]
+        game = sp.local("game", self.data.games[params.game_id]).value
         sp.verify(game.outcome!=-1, message = "Error: current game is already archived")
-        self.data.archived_games[params.game_id] = game
+        # Winners share the whole pool and the jackpot; if nobody backed the outcome (or the game is cancelled) everyone is refunded
+        winning_pool = sp.local("winning_pool", game.bet_amount_on.get(game.outcome, default_value = sp.tez(0)))
+        to_pay = sp.local("to_pay", game.bets_by_choice.get(game.outcome, default_value = sp.int(0)))
+        ticket_stake = sp.local("ticket_stake", game.ticket_stake_on.get(game.outcome, default_value = sp.tez(0)))
+        refund = sp.local("refund", winning_pool.value == sp.tez(0))
+        sp.if refund.value:
+            winning_pool.value = game.total_bet_amount
+            to_pay.value = game.bettors
+            ticket_stake.value = sp.tez(0)
+            sp.for stake in game.ticket_stake_on.values():
+                ticket_stake.value += stake
+
+        # Frozen once so that every redemption pays the same share, whatever the redemption order
+        game.settlement = settlement_of(game, winning_pool.value, to_pay.value, ticket_stake.value, refund.value)
+        self.data.games[params.game_id] = game
+        emit_event("settlement", sp.record(
+            game_id=params.game_id,
+            outcome=game.outcome,
+            refund=refund.value,
+            pool=game.total_bet_amount + game.jackpot,
+            winning_pool=winning_pool.value))
+        self.data.archived_games[params.game_id] = sp.record(
+            outcome=game.outcome,
+            total_bet_amount=game.total_bet_amount,
+            bet_amount_on=game.bet_amount_on,
+            jackpot=game.jackpot,
+            redeemed=sp.int(0),
+            payout_ratio=sp.record(
+                numerator=game.settlement.numerator,
+                denominator=game.settlement.denominator),
+            positions=game.positions_opened,
+            claim_deadline=sp.now.add_days(CLAIM_PERIOD_DAYS)
+        )
+        self.data.sweep_queue[self.data.sweep_tail] = params.game_id
+        self.data.sweep_tail += 1
+
+    def delete_game(self, game_id):
+        game = self.data.games[game_id]
+        self.data.archived_games[game_id].redeemed = game.redeemed
+        # Rounding leftovers of the payouts are not owed to anyone anymore
+        self.data.remainder += game.settlement.unpaid
+        emit_event("game_deleted", sp.record(game_id=game_id, remainder=game.settlement.unpaid))
+        del self.data.games[game_id]
 
     @sp.entry_point
     def redeem_tez(self, game_id):
-        sp.verify(self.data.games.contains(game_id),message="Error: this match does not exist anymore!")
-        game = self.data.games[game_id]
-        sp.verify(game.bet_amount_by_user.contains(sp.sender),message="Error: you did not place a bet on this match")
-        sp.verify(game.outcome != -1, message = "Error, you cannot redeem your winnings yet")
-        bet_by_user = game.bet_amount_by_user[sp.sender]
-        total_bet_by_user=bet_by_user.team_a + bet_by_user.team_b + bet_by_user.tie
-        sp.verify((game.outcome == sp.int(10)) | ((game.outcome == sp.int(0)) & (bet_by_user.team_a > sp.tez(0))) | ((game.outcome == sp.int(1)) & (bet_by_user.team_b > sp.tez(0))) | ((game.outcome == sp.int(2)) & (bet_by_user.tie > sp.tez(0))), message="Error: you have lost your bet! :(")
+        sp.send(sp.sender, self.redeem(sp.record(game_id=game_id, bettor=sp.sender, settling=False)))
 
+    # Redeems several games at once and pays the sum of the winnings in a single transfer
+    @sp.entry_point
+    def redeem_many(self, game_ids):
+        sp.set_type(game_ids, sp.TList(sp.TInt))
         amount_to_send = sp.local("amount_to_send", sp.tez(0))
-        jackpot_share = sp.local("jackpot_share", sp.tez(0))
-        repayment_allowed=sp.bool(False)
-
-        # If a game is postponed or delayed, each player gets his money back
-        sp.if game.outcome == sp.int(10):
-            amount_to_send.value = bet_by_user.team_a + bet_by_user.team_b + bet_by_user.tie
-            jackpot_share.value+=sp.split_tokens(game.jackpot,sp.utils.mutez_to_nat(bet_by_user.team_a+bet_by_user.team_b+bet_by_user.tie),sp.utils.mutez_to_nat(game.total_bet_amount))
-            bet_by_user.team_a = sp.tez(0)
-            bet_by_user.team_b = sp.tez(0)
-            bet_by_user.tie = sp.tez(0)
-
-        sp.if game.outcome == sp.int(0):
-            sp.if game.bet_amount_on.team_a>sp.tez(0):
-                amount_to_send.value = sp.split_tokens(bet_by_user.team_a, sp.utils.mutez_to_nat(game.total_bet_amount), sp.utils.mutez_to_nat(game.bet_amount_on.team_a))
-                jackpot_share.value+=sp.split_tokens(game.jackpot,sp.utils.mutez_to_nat(bet_by_user.team_a),sp.utils.mutez_to_nat(game.bet_amount_on.team_a))
-                bet_by_user.team_a = sp.tez(0)            
-            sp.else:
-                amount_to_send.value=total_bet_by_user
-                jackpot_share.value+=sp.split_tokens(game.jackpot,sp.utils.mutez_to_nat(total_bet_by_user),sp.utils.mutez_to_nat(game.total_bet_amount))
-                bet_by_user.team_b=sp.tez(0)  
-                bet_by_user.tie=sp.tez(0)
-                repayment_allowed=True
-
-        sp.if game.outcome == sp.int(1):
-            sp.if game.bet_amount_on.team_b>sp.tez(0):
-                amount_to_send.value = sp.split_tokens(bet_by_user.team_b, sp.utils.mutez_to_nat(game.total_bet_amount), sp.utils.mutez_to_nat(game.bet_amount_on.team_b))
-                jackpot_share.value+=sp.split_tokens(game.jackpot,sp.utils.mutez_to_nat(bet_by_user.team_b),sp.utils.mutez_to_nat(game.bet_amount_on.team_b))
-                bet_by_user.team_b = sp.tez(0)
+        sp.for game_id in game_ids:
+            amount_to_send.value += self.redeem(sp.record(game_id=game_id, bettor=sp.sender, settling=False))
+        sp.send(sp.sender, amount_to_send.value)
+
+    # Walks up to max_count bettor slots of a finished game in order of arrival, paying the winners and pruning the losing
+    # positions on the way. max_count bounds the slots walked, including losers and bettors who already redeemed or left,
+    # not the number of winners paid.
+    @sp.entry_point
+    def settle_batch(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, max_count=sp.TNat))
+        sp.verify_equal(sp.sender, self.data.admin, message = "Error: you cannot settle this game")
+        sp.verify(self.data.games.contains(params.game_id), message = "Error: this match does not exist")
+        game = self.data.games[params.game_id]
+        sp.verify(game.outcome != -1, message = "Error, you cannot settle this game yet")
+        cursor = sp.local("cursor", game.settle_cursor)
+        last = sp.local("last", sp.min(game.settle_cursor + params.max_count, game.positions_opened))
+        sp.while (cursor.value < last.value) & self.data.games.contains(params.game_id):
+            index_key = sp.pair(params.game_id, cursor.value)
+            bettor = sp.local("bettor", self.data.bettor_index[index_key]).value
+            del self.data.bettor_index[index_key]
+            # The position is gone if the bettor already redeemed or removed all their bets
+            sp.if self.data.bet_amount_by_user.contains(sp.pair(params.game_id, bettor)):
+                amount_to_send = sp.local("amount_to_send", self.redeem(sp.record(game_id=params.game_id, bettor=bettor, settling=True))).value
+                sp.if amount_to_send > sp.tez(0):
+                    sp.send(bettor, amount_to_send)
+            cursor.value += 1
+        sp.if self.data.games.contains(params.game_id):
+            self.data.games[params.game_id].settle_cursor = cursor.value
+
+    # Reclaims settled games whose claim deadline has passed, visiting at most max_items bettor slots or games.
+    # Remaining positions are dropped and whatever was not redeemed (jackpot and rounding included) goes to remainder.
+    # The slots of games deleted without bets are cleared first, as nothing is owed on them.
+    @sp.entry_point
+    def sweep(self, max_items):
+        sp.set_type(max_items, sp.TNat)
+        items = sp.local("items", sp.nat(0))
+        sp.while (items.value < max_items) & (self.data.emptied_head < self.data.emptied_tail):
+            emptied_id = sp.local("emptied_id", self.data.emptied_queue[self.data.emptied_head]).value
+            slots = sp.local("slots", self.data.emptied_games[emptied_id]).value
+            sp.if slots > 0:
+                # Every bettor removed all their bets, only the slot is left
+                del self.data.bettor_index[sp.pair(emptied_id, sp.as_nat(slots - 1))]
+                self.data.emptied_games[emptied_id] = sp.as_nat(slots - 1)
             sp.else:
-                amount_to_send.value=total_bet_by_user
-                jackpot_share.value+=sp.split_tokens(game.jackpot,sp.utils.mutez_to_nat(total_bet_by_user),sp.utils.mutez_to_nat(game.total_bet_amount))
-                bet_by_user.team_a=sp.tez(0)  
-                bet_by_user.tie=sp.tez(0)
-                repayment_allowed=True
-
-        sp.if game.outcome == sp.int(2):
-            sp.if game.bet_amount_on.tie>sp.tez(0):
-                amount_to_send.value = sp.split_tokens(bet_by_user.tie, sp.utils.mutez_to_nat(game.total_bet_amount), sp.utils.mutez_to_nat(game.bet_amount_on.tie))
-                jackpot_share.value+=sp.split_tokens(game.jackpot,sp.utils.mutez_to_nat(bet_by_user.tie),sp.utils.mutez_to_nat(game.bet_amount_on.tie))
-                bet_by_user.tie = sp.tez(0)
+                del self.data.emptied_games[emptied_id]
+                del self.data.emptied_queue[self.data.emptied_head]
+                self.data.emptied_head += 1
+            items.value += 1
+        running = sp.local("running", True)
+        sp.while running.value & (items.value < max_items) & (self.data.sweep_head < self.data.sweep_tail):
+            game_id = sp.local("game_id", self.data.sweep_queue[self.data.sweep_head]).value
+            archive = self.data.archived_games[game_id]
+            sp.if sp.now < archive.claim_deadline:
+                running.value = False
             sp.else:
-                amount_to_send.value=total_bet_by_user
-                jackpot_share.value+=sp.split_tokens(game.jackpot,sp.utils.mutez_to_nat(total_bet_by_user),sp.utils.mutez_to_nat(game.total_bet_amount))
-                bet_by_user.team_a=sp.tez(0)  
-                bet_by_user.team_b=sp.tez(0)
-                repayment_allowed=True
-        
-        game.jackpot-=jackpot_share.value
-        sp.send(sp.sender, amount_to_send.value+jackpot_share.value)
-        game.redeemed += 1
+                sp.if self.data.sweep_cursor < archive.positions:
+                    index_key = sp.pair(game_id, self.data.sweep_cursor)
+                    # settle_batch already removed the slots it walked
+                    sp.if self.data.bettor_index.contains(index_key):
+                        bettor = sp.local("bettor", self.data.bettor_index[index_key]).value
+                        del self.data.bettor_index[index_key]
+                        sp.if self.data.bet_amount_by_user.contains(sp.pair(game_id, bettor)):
+                            del self.data.bet_amount_by_user[sp.pair(game_id, bettor)]
+                            self.close_position(bettor, game_id)
+                            emit_event("prune", sp.record(game_id=game_id, bettor=bettor))
+                    self.data.sweep_cursor += 1
+                sp.else:
+                    sp.if self.data.games.contains(game_id):
+                        self.delete_game(game_id)
+                    del self.data.archived_games[game_id]
+                    del self.data.sweep_queue[self.data.sweep_head]
+                    self.data.sweep_head += 1
+                    self.data.sweep_cursor = 0
+                items.value += 1
 
-        sp.if (bet_by_user.team_a == sp.mutez(0)) & (bet_by_user.team_b == sp.tez(0)) & (bet_by_user.tie == sp.tez(0)):
-            del game.bet_amount_by_user[sp.sender]
+    @sp.private_lambda(with_storage="read-write", with_operations=True, wrap_call=True)
+    def redeem(self, params):
+        game_id = params.game_id
+        sp.verify(self.data.games.contains(game_id),message="Error: this match does not exist anymore!")
+        bet_key = sp.pair(game_id, params.bettor)
+        sp.verify(self.data.bet_amount_by_user.contains(bet_key),message="Error: you did not place a bet on this match")
+        game = sp.local("game", self.data.games[game_id]).value
+        sp.verify(game.outcome != -1, message = "Error, you cannot redeem your winnings yet")
+        bet_by_user = sp.local("bet_by_user", self.data.bet_amount_by_user[bet_key]).value
 
-        sp.if repayment_allowed==False:
-            sp.if (game.outcome == sp.int(0)) & (game.redeemed == game.bets_by_choice.team_a):
-                del self.data.games[game_id]
-            sp.else:
-                sp.if (game.outcome == sp.int(1)) & (game.redeemed == game.bets_by_choice.team_b):
-                    del self.data.games[game_id]
-                sp.else:
-                    sp.if (game.outcome == sp.int(2)) & (game.redeemed == game.bets_by_choice.tie):
-                        del self.data.games[game_id]
+        stake = sp.local("stake", bet_by_user.stakes.get(game.outcome, default_value = sp.tez(0)))
+        sp.if game.settlement.refund:
+            sp.for amount in bet_by_user.stakes.values():
+                stake.value += amount
+        # Losing positions are only pruned when the operator settles the game
+        sp.verify((stake.value > sp.tez(0)) | params.settling, message="Error: you have lost your bet! :(")
+
+        amount_to_send = sp.local("amount_to_send", sp.tez(0))
+        sp.if stake.value > sp.tez(0):
+            amount_to_send.value = sp.split_tokens(stake.value, game.settlement.numerator, game.settlement.denominator)
+            game.settlement.unpaid -= amount_to_send.value
+            game.settlement.to_pay -= sp.int(1)
+            game.redeemed += 1
+            emit_event("redeem", sp.record(game_id=game_id, bettor=params.bettor, amount=amount_to_send.value))
         sp.else:
-            sp.if sp.len(game.bet_amount_by_user)==0:
-                del self.data.games[game_id]
+            emit_event("prune", sp.record(game_id=game_id, bettor=params.bettor))
+
+        # Once the game is settled, whatever the bettor staked on other outcomes is lost: drop the whole position
+        del self.data.bet_amount_by_user[bet_key]
+        self.close_position(params.bettor, game_id)
+        game.bettors -= sp.int(1)
+        self.data.games[game_id] = game
 
-    # Below entry points mimick the future oracle behaviour and are not meant to stay
+        sp.if (game.settlement.to_pay == 0) & (game.settlement.ticket_stake == sp.tez(0)):
+            self.delete_game(game_id)
+
+        sp.result(amount_to_send.value)
+
+    # The admin can still post results by hand, when the oracle cannot report a game
     @sp.entry_point
     def set_outcome(self, params):
-        sp.verify_equal(self.data.games[params.game_id].outcome, -1, "Error: current game outcome has already been set")
         sp.verify_equal(sp.sender, self.data.admin, message = "Error: you cannot update the game status")
-        sp.verify((params.choice == 0) | (params.choice == 1) | (params.choice == 2) | (params.choice == 10), message = "Error: entered value must be comprised in {0;1;2}")
+        self.post_outcome(params)
+
+    # Posts the results of a whole matchday at once
+    @sp.entry_point
+    def set_outcomes(self, outcomes):
+        sp.set_type(outcomes, sp.TList(RESULT_TYPE))
+        sp.verify_equal(sp.sender, self.data.admin, message = "Error: you cannot update the game status")
+        sp.for params in outcomes:
+            self.post_outcome(params)
+
+    @sp.entry_point
+    def set_oracle(self, oracle):
+        sp.set_type(oracle, sp.TAddress)
+        sp.verify_equal(sp.sender, self.data.admin, message = "Error: you cannot change the oracle")
+        self.data.oracle = oracle
+
+    # Callback of the oracle carrying the results of many games, validated and applied as set_outcomes does.
+    # The whole batch fails if one of the results is not valid.
+    @sp.entry_point
+    def receive_results(self, results):
+        sp.set_type(results, sp.TList(RESULT_TYPE))
+        sp.verify_equal(sp.sender, self.data.oracle, message = "Error: only the oracle can push results")
+        sp.for params in results:
+            self.post_outcome(params)
+
+    # Games held by a market are settled there, the factory only relays the outcome
+    def post_outcome(self, params):
+        sp.if self.data.markets.contains(params.game_id):
+            sp.transfer(params.choice, sp.tez(0), sp.contract(sp.TInt, self.data.markets[params.game_id], entry_point="set_outcome").open_some())
+        sp.else:
+            self.apply_outcome(params)
+
+    def apply_outcome(self, params):
+        sp.verify_equal(self.data.games[params.game_id].outcome, -1, "Error: current game outcome has already been set")
         sp.verify(self.data.games.contains(params.game_id), message = "Error: this match does not exist")
         game = self.data.games[params.game_id]
-        sp.if params.choice != 10:
+        sp.verify(((params.choice >= 0) & (params.choice < game.outcomes)) | (params.choice == CANCELLED), message = "Error: this outcome does not exist")
+        sp.if params.choice != CANCELLED:
             sp.verify(sp.now > game.match_timestamp, message = "Error: match has not started yet") 
         game.outcome = params.choice
-        sp.if (game.bet_amount_on.team_a == sp.tez(0)) & (game.bet_amount_on.team_b == sp.tez(0)) & (game.bet_amount_on.tie == sp.tez(0)):
+        emit_event("outcome", sp.record(game_id=params.game_id, outcome=params.choice))
+        sp.if game.total_bet_amount == sp.tez(0):
+            emit_event("game_deleted", sp.record(game_id=params.game_id, remainder=game.jackpot))
             sp.if game.jackpot>sp.tez(0):
                 self.data.remainder+=game.jackpot
                 game.jackpot=sp.tez(0)
+            # Bettors who removed all their bets still hold a bettor_index slot, queued apart from the settled games
+            # so that sweep clears them without waiting for any claim deadline
+            sp.if game.positions_opened > 0:
+                self.data.emptied_games[params.game_id] = game.positions_opened
+                self.data.emptied_queue[self.data.emptied_tail] = params.game_id
+                self.data.emptied_tail += 1
             del self.data.games[params.game_id]
         sp.else:
             self.archive_game(params)
 
-    # Above entry points mimick the future oracle behaviour and are not meant to stay
+    # Views read a single game and position so that clients do not need to download the games map
+
+    # Pool shared by the winners (jackpot included) and stake on each outcome, the odds of an outcome being pool / stake
+    @sp.onchain_view()
+    def get_odds(self, game_id):
+        sp.set_type(game_id, sp.TInt)
+        sp.verify(self.data.games.contains(game_id), message="Error: this match does not exist")
+        game = self.data.games[game_id]
+        sp.result(sp.record(
+            outcome=game.outcome,
+            pool=game.total_bet_amount + game.jackpot,
+            bet_amount_on=game.bet_amount_on))
+
+    # Payout of the bettor if they add amount on choice and that outcome wins, counting the jackpot gathered so far
+    @sp.onchain_view()
+    def potential_gain(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, bettor=sp.TAddress, choice=sp.TInt, amount=sp.TMutez))
+        sp.verify(self.data.games.contains(params.game_id), message="Error: this match does not exist")
+        game = self.data.games[params.game_id]
+        sp.verify(game.outcome == -1, message="Error: this game already has an outcome")
+        sp.verify((params.choice >= 0) & (params.choice < game.outcomes), message="Error: this outcome does not exist")
+        position = self.data.bet_amount_by_user.get(sp.pair(params.game_id, params.bettor), default_value=sp.record(
+            timestamp=sp.now,
+            stakes=sp.map(tkey=sp.TInt, tvalue=sp.TMutez)))
+        stake = sp.local("stake", position.stakes.get(params.choice, default_value=sp.tez(0)) + params.amount).value
+        gain = sp.local("gain", sp.tez(0))
+        sp.if stake > sp.tez(0):
+            gain.value = sp.split_tokens(stake,
+                sp.utils.mutez_to_nat(game.total_bet_amount + game.jackpot + params.amount),
+                sp.utils.mutez_to_nat(game.bet_amount_on.get(params.choice, default_value=sp.tez(0)) + params.amount))
+        sp.result(gain.value)
+
+    @sp.onchain_view()
+    def get_position(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, bettor=sp.TAddress))
+        sp.verify(self.data.bet_amount_by_user.contains(sp.pair(params.game_id, params.bettor)), message="Error: you do not have any bets on this match")
+        sp.result(self.data.bet_amount_by_user[sp.pair(params.game_id, params.bettor)])
+
+    # Games still running or awaiting redemption in which the bettor holds a position. Losing positions
+    # outlive their game until settle_batch prunes them, so deleted games are filtered out here.
+    @sp.onchain_view()
+    def get_open_games(self, bettor):
+        sp.set_type(bettor, sp.TAddress)
+        open_games = sp.local("open_games", sp.set(t=sp.TInt))
+        sp.if self.data.games_by_user.contains(bettor):
+            sp.for game_id in self.data.games_by_user[bettor].elements():
+                sp.if self.data.games.contains(game_id):
+                    open_games.value.add(game_id)
+        sp.result(open_games.value)
+
+    # Fee the bettor would pay to remove all their bets on the game, as charged by unbet
+    @sp.onchain_view()
+    def unbet_fee(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, bettor=sp.TAddress))
+        sp.verify(self.data.games.contains(params.game_id), message="Error: this match does not exist")
+        sp.verify(self.data.bet_amount_by_user.contains(sp.pair(params.game_id, params.bettor)), message="Error: you do not have any bets to remove")
+        position = self.data.bet_amount_by_user[sp.pair(params.game_id, params.bettor)]
+        amount = sp.local("amount", sp.tez(0))
+        sp.for stake in position.stakes.values():
+            amount.value += stake
+        sp.result(compute_service_fee(sp.record(
+            match_timestamp=self.data.games[params.game_id].match_timestamp,
+            bet_timestamp=position.timestamp,
+            amount=amount.value)))
+
+
+class SoccerBetMarket(sp.Contract):
+    """Single game originated by SoccerBetFactory.new_market. Its pools, positions and jackpot live in their own
+    storage, so that the cost of a call does not depend on any other game. The outcome comes from the factory,
+    which also collects what is left once every winner has been paid."""
+    def __init__(self):
+        self.init_type(sp.TRecord(
+            factory=sp.TAddress,
+            admin=sp.TAddress,
+            game_id=sp.TInt,
+            game=GAME_TYPE,
+            bet_amount_by_user=sp.TBigMap(sp.TAddress, BET_TYPE),
+            # Bettors in order of arrival, walked by settle_batch
+            bettor_index=sp.TBigMap(sp.TNat, sp.TAddress),
+            # Set once the remainder has been handed back to the factory
+            closed=sp.TBool
+        ))
+
+    @sp.entry_point
+    def bet(self, choice):
+        sp.set_type(choice, sp.TInt)
+        game = sp.local("game", self.data.game).value
+        sp.verify(sp.now < game.match_timestamp,message = "Error, you cannot place a bet anymore")
+        sp.verify(game.outcome == -1, message = "Error, you cannot place a bet anymore")
+        sp.verify(sp.amount > sp.tez(0), message = "Error: a bet must carry a positive amount")
+        sp.verify((choice >= 0) & (choice < game.outcomes), message = "Error: this outcome does not exist")
+        bet_by_user = sp.local("bet_by_user", self.data.bet_amount_by_user.get(sp.sender, default_value = sp.record(
+                timestamp=sp.now,
+                stakes=sp.map(tkey=sp.TInt, tvalue=sp.TMutez)))).value
+
+        sp.if sp.len(bet_by_user.stakes) == 0:
+            game.bettors += sp.int(1)
+            self.data.bettor_index[game.positions_opened] = sp.sender
+            game.positions_opened += 1
+        sp.if ~bet_by_user.stakes.contains(choice):
+            game.bets_by_choice[choice] = game.bets_by_choice.get(choice, default_value = sp.int(0)) + 1
+        bet_by_user.stakes[choice] = bet_by_user.stakes.get(choice, default_value = sp.tez(0)) + sp.amount
+        game.bet_amount_on[choice] = game.bet_amount_on.get(choice, default_value = sp.tez(0)) + sp.amount
+        game.total_bet_amount += sp.amount
+
+        self.data.bet_amount_by_user[sp.sender] = bet_by_user
+        self.data.game = game
+        emit_event("bet", sp.record(game_id=self.data.game_id, bettor=sp.sender, choice=choice, amount=sp.amount))
+
+    # Removes the bets on one outcome, or on every outcome when choice is -1
+    @sp.entry_point
+    def unbet(self, choice):
+        sp.set_type(choice, sp.TInt)
+        sp.verify(self.data.bet_amount_by_user.contains(sp.sender),message="Error: you do not have any bets to remove")
+        game = sp.local("game", self.data.game).value
+        sp.verify(sp.now < game.match_timestamp, message = "Error, you cannot remove a bet anymore")
+        sp.verify(game.outcome == -1, message = "Error, you cannot remove a bet anymore")
+        amount_to_send = sp.local("amount_to_send", sp.tez(0))
+        bet_by_user = sp.local("bet_by_user", self.data.bet_amount_by_user[sp.sender]).value
+
+        sp.if choice == -1:
+            sp.for stake in bet_by_user.stakes.items():
+                game.bet_amount_on[stake.key] -= stake.value
+                game.bets_by_choice[stake.key] -= sp.int(1)
+                amount_to_send.value += stake.value
+            bet_by_user.stakes = sp.map(tkey=sp.TInt, tvalue=sp.TMutez)
+        sp.else:
+            sp.verify(bet_by_user.stakes.contains(choice), message="Error: you have not placed any bets on this outcome")
+            amount_to_send.value = bet_by_user.stakes[choice]
+            game.bet_amount_on[choice] -= amount_to_send.value
+            game.bets_by_choice[choice] -= sp.int(1)
+            del bet_by_user.stakes[choice]
+
+        service_fee = compute_service_fee(sp.record(
+            match_timestamp=game.match_timestamp,
+            bet_timestamp=bet_by_user.timestamp,
+            amount=amount_to_send.value))
+        game.jackpot+=service_fee
+        game.total_bet_amount -= amount_to_send.value
+        emit_event("unbet", sp.record(game_id=self.data.game_id, bettor=sp.sender, choice=choice, amount=amount_to_send.value, fee=service_fee))
+        sp.send(sp.sender, amount_to_send.value - service_fee)
+
+        sp.if sp.len(bet_by_user.stakes) == 0:
+            del self.data.bet_amount_by_user[sp.sender]
+            game.bettors -= sp.int(1)
+        sp.else:
+            self.data.bet_amount_by_user[sp.sender] = bet_by_user
+        self.data.game = game
+
+    # Relayed by the factory, which holds the outcome authority
+    @sp.entry_point
+    def set_outcome(self, choice):
+        sp.set_type(choice, sp.TInt)
+        sp.verify_equal(sp.sender, self.data.factory, message = "Error: you cannot update the game status")
+        game = sp.local("game", self.data.game).value
+        sp.verify_equal(game.outcome, -1, "Error: current game outcome has already been set")
+        sp.verify(((choice >= 0) & (choice < game.outcomes)) | (choice == CANCELLED), message = "Error: this outcome does not exist")
+        sp.if choice != CANCELLED:
+            sp.verify(sp.now > game.match_timestamp, message = "Error: match has not started yet")
+        game.outcome = choice
+        emit_event("outcome", sp.record(game_id=self.data.game_id, outcome=choice))
+        sp.if game.total_bet_amount == sp.tez(0):
+            self.data.game = game
+            self.close(game.jackpot)
+        sp.else:
+            # Same settlement as SoccerBetFactory.archive_game, without tickets
+            winning_pool = sp.local("winning_pool", game.bet_amount_on.get(choice, default_value = sp.tez(0)))
+            to_pay = sp.local("to_pay", game.bets_by_choice.get(choice, default_value = sp.int(0)))
+            refund = sp.local("refund", winning_pool.value == sp.tez(0))
+            sp.if refund.value:
+                winning_pool.value = game.total_bet_amount
+                to_pay.value = game.bettors
+            game.settlement = settlement_of(game, winning_pool.value, to_pay.value, sp.tez(0), refund.value)
+            self.data.game = game
+            emit_event("settlement", sp.record(
+                game_id=self.data.game_id,
+                outcome=choice,
+                refund=refund.value,
+                pool=game.total_bet_amount + game.jackpot,
+                winning_pool=winning_pool.value))
+
+    # Hands what nobody is owed anymore back to the factory, which adds it to its remainder
+    def close(self, remainder):
+        self.data.closed = True
+        emit_event("game_deleted", sp.record(game_id=self.data.game_id, remainder=remainder))
+        sp.transfer(self.data.game_id, remainder, sp.contract(sp.TInt, self.data.factory, entry_point="collect_remainder").open_some())
+
+    @sp.entry_point
+    def redeem_tez(self):
+        sp.send(sp.sender, self.redeem(sp.record(bettor=sp.sender, settling=False)))
+
+    # Walks up to max_count bettor slots in order of arrival, paying the winners and pruning the losing positions on the way.
+    # As for SoccerBetFactory.settle_batch, max_count bounds the slots walked, not the number of winners paid.
+    @sp.entry_point
+    def settle_batch(self, max_count):
+        sp.set_type(max_count, sp.TNat)
+        sp.verify_equal(sp.sender, self.data.admin, message = "Error: you cannot settle this game")
+        sp.verify(self.data.game.outcome != -1, message = "Error, you cannot settle this game yet")
+        cursor = sp.local("cursor", self.data.game.settle_cursor)
+        last = sp.local("last", sp.min(self.data.game.settle_cursor + max_count, self.data.game.positions_opened))
+        sp.while (cursor.value < last.value) & ~self.data.closed:
+            bettor = sp.local("bettor", self.data.bettor_index[cursor.value]).value
+            del self.data.bettor_index[cursor.value]
+            sp.if self.data.bet_amount_by_user.contains(bettor):
+                amount_to_send = sp.local("amount_to_send", self.redeem(sp.record(bettor=bettor, settling=True))).value
+                sp.if amount_to_send > sp.tez(0):
+                    sp.send(bettor, amount_to_send)
+            cursor.value += 1
+        self.data.game.settle_cursor = cursor.value
+
+    @sp.private_lambda(with_storage="read-write", with_operations=True, wrap_call=True)
+    def redeem(self, params):
+        sp.verify(~self.data.closed, message="Error: this match does not exist anymore!")
+        sp.verify(self.data.bet_amount_by_user.contains(params.bettor),message="Error: you did not place a bet on this match")
+        game = sp.local("game", self.data.game).value
+        sp.verify(game.outcome != -1, message = "Error, you cannot redeem your winnings yet")
+        bet_by_user = sp.local("bet_by_user", self.data.bet_amount_by_user[params.bettor]).value
+
+        stake = sp.local("stake", bet_by_user.stakes.get(game.outcome, default_value = sp.tez(0)))
+        sp.if game.settlement.refund:
+            sp.for amount in bet_by_user.stakes.values():
+                stake.value += amount
+        sp.verify((stake.value > sp.tez(0)) | params.settling, message="Error: you have lost your bet! :(")
+
+        amount_to_send = sp.local("amount_to_send", sp.tez(0))
+        sp.if stake.value > sp.tez(0):
+            amount_to_send.value = sp.split_tokens(stake.value, game.settlement.numerator, game.settlement.denominator)
+            game.settlement.unpaid -= amount_to_send.value
+            game.settlement.to_pay -= sp.int(1)
+            game.redeemed += 1
+            emit_event("redeem", sp.record(game_id=self.data.game_id, bettor=params.bettor, amount=amount_to_send.value))
+        sp.else:
+            emit_event("prune", sp.record(game_id=self.data.game_id, bettor=params.bettor))
+
+        del self.data.bet_amount_by_user[params.bettor]
+        game.bettors -= sp.int(1)
+        self.data.game = game
+
+        sp.if game.settlement.to_pay == 0:
+            self.close(game.settlement.unpaid)
+
+        sp.result(amount_to_send.value)
+
+    @sp.onchain_view()
+    def get_odds(self):
+        sp.result(sp.record(
+            outcome=self.data.game.outcome,
+            pool=self.data.game.total_bet_amount + self.data.game.jackpot,
+            bet_amount_on=self.data.game.bet_amount_on))
+
+    @sp.onchain_view()
+    def get_position(self, bettor):
+        sp.set_type(bettor, sp.TAddress)
+        sp.verify(self.data.bet_amount_by_user.contains(bettor), message="Error: you do not have any bets on this match")
+        sp.result(self.data.bet_amount_by_user[bettor])
+
+
+class MockOracle(sp.Contract):
+    """Local stand-in for the results oracle: its operator publishes the results of a matchday, pushed to the factory in a single callback"""
+    def __init__(self, operator, factory):
+        self.init(
+            operator=operator,
+            factory=factory,
+            published=sp.nat(0)
+        )
+
+    @sp.entry_point
+    def publish(self, results):
+        sp.set_type(results, sp.TList(RESULT_TYPE))
+        sp.verify_equal(sp.sender, self.data.operator, message = "Error: you cannot publish results")
+        self.data.published += sp.len(results)
+        sp.transfer(results, sp.tez(0), sp.contract(sp.TList(RESULT_TYPE), self.data.factory, entry_point="receive_results").open_some())
+
+
+class BetReceiptWallet(sp.Contract):
+    """Stand-in for a bettor's wallet holding the tickets handed out in ticket mode, on behalf of its owner"""
+    def __init__(self, factory, owner):
+        self.init(
+            factory=factory,
+            owner=owner,
+            receipts=sp.map(tkey=sp.TNat, tvalue=sp.TTicket(RECEIPT_TYPE)),
+            next_receipt=sp.nat(0)
+        )
+
+    # Payouts and refunds of the factory go straight to the owner
+    @sp.entry_point
+    def default(self):
+        sp.if sp.amount > sp.tez(0):
+            sp.send(self.data.owner, sp.amount)
+
+    @sp.entry_point
+    def bet(self, params):
+        sp.set_type(params, sp.TRecord(game_id=sp.TInt, choice=sp.TInt))
+        sp.verify_equal(sp.sender, self.data.owner, message="Error: only the owner can use this wallet")
+        factory = sp.contract(sp.TRecord(game_id=sp.TInt, choice=sp.TInt, receiver=sp.TContract(sp.TTicket(RECEIPT_TYPE))), self.data.factory, entry_point="bet_with_ticket").open_some()
+        sp.transfer(sp.record(game_id=params.game_id, choice=params.choice, receiver=sp.self_entry_point("receive_receipt")), sp.amount, factory)
+
+    @sp.entry_point
+    def receive_receipt(self, receipt):
+        sp.set_type(receipt, sp.TTicket(RECEIPT_TYPE))
+        with sp.modify_record(self.data, "data") as data:
+            data.receipts[data.next_receipt] = receipt
+            data.next_receipt += 1
+
+    @sp.entry_point
+    def return_receipt(self, params):
+        sp.set_type(params, sp.TRecord(receipt_id=sp.TNat, redeem=sp.TBool))
+        sp.verify_equal(sp.sender, self.data.owner, message="Error: only the owner can use this wallet")
+        with sp.modify_record(self.data, "data") as data:
+            receipt, receipts = sp.match_tuple(sp.get_and_update(data.receipts, params.receipt_id, sp.none), "receipt", "receipts")
+            data.receipts = receipts
+            sp.if params.redeem:
+                sp.transfer(receipt.open_some(), sp.tez(0), sp.contract(sp.TTicket(RECEIPT_TYPE), data.factory, entry_point="redeem_ticket").open_some())
+            sp.else:
+                sp.transfer(receipt.open_some(), sp.tez(0), sp.contract(sp.TTicket(RECEIPT_TYPE), data.factory, entry_point="unbet_ticket").open_some())
 
 
 @sp.add_test(name="Test Match Contract")
@@ -294,7 +1038,8 @@ def test():
         game_id=game1,
         team_a="France",
         team_b="Angleterre",
-        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
     )).run(sender=admin)
 
     game2 = 2
@@ -302,7 +1047,8 @@ def test():
         game_id=game2,
         team_a="Nice",
         team_b="Marseille",
-        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
     )).run(sender=admin)
 
     game3 = 3
@@ -310,7 +1056,8 @@ def test():
         game_id=game3,
         team_a="Lorient",
         team_b="Vannes",
-        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
     )).run(sender=admin)
 
     game5 = 5
@@ -318,7 +1065,8 @@ def test():
         game_id=game5,
         team_a="Olympique Lyonnais",
         team_b="PSG",
-        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
     )).run(sender=admin)
 
     game6 = 6
@@ -326,7 +1074,8 @@ def test():
         game_id=game6,
         team_a="Luxembourg",
         team_b="Malte",
-        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
     )).run(sender=admin)
 
     game7 = 7
@@ -334,7 +1083,8 @@ def test():
         game_id=game7,
         team_a="Irlande",
         team_b="Ecosse",
-        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 40)
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 40),
+        outcomes=3
     )).run(sender=admin)
 
     game8 = 8
@@ -342,78 +1092,116 @@ def test():
         game_id=game8,
         team_a="Allemagne",
         team_b="Pologne",
-        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 3)
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 3),
+        outcomes=3
     )).run(sender=admin)
 
     scenario.h1("Testing bet placing")
 
     # Betting on game 1 
 
-    scenario += factory.bet_on_team_a(game1).run(
+    scenario += factory.bet(sp.record(game_id=game1, choice=0)).run(
         sender=pierre_antoine.address, amount=sp.tez(2000))
 
-    scenario += factory.bet_on_team_b(game1).run(
+    scenario += factory.bet(sp.record(game_id=game1, choice=1)).run(
         sender=victor.address, amount=sp.tez(5000))
 
-    scenario += factory.bet_on_team_a(game1).run(sender=alice.address, amount=sp.tez(100), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 0))
+    scenario += factory.bet(sp.record(game_id=game1, choice=0)).run(sender=alice.address, amount=sp.tez(100), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 0))
 
-    scenario += factory.bet_on_team_b(game1).run(
+    scenario += factory.bet(sp.record(game_id=game1, choice=1)).run(
         sender=mathis.address, amount=sp.tez(1000))
 
-    scenario += factory.bet_on_tie(game1).run(
+    scenario += factory.bet(sp.record(game_id=game1, choice=2)).run(
         sender=bob.address,amount=sp.tez(2000))
 
+    # Views on game 1: 2100 tez on France, 6000 on England and 2000 on a tie
+    scenario.verify(factory.get_odds(game1).pool == sp.tez(10100))
+    scenario.verify(factory.get_odds(game1).bet_amount_on[1] == sp.tez(6000))
+    scenario.verify(factory.get_position(sp.record(game_id=game1, bettor=alice.address)).stakes[0] == sp.tez(100))
+    scenario.verify(factory.potential_gain(sp.record(game_id=game1, bettor=alice.address, choice=0, amount=sp.tez(0))) == sp.mutez(480952380))
+    scenario.verify(factory.potential_gain(sp.record(game_id=game1, bettor=alice.address, choice=0, amount=sp.tez(900))) == sp.mutez(3666666666))
+    scenario.verify(factory.potential_gain(sp.record(game_id=game1, bettor=olivier.address, choice=2, amount=sp.tez(0))) == sp.tez(0))
+    # Alice bet one second before kickoff and would pay the full 20% fee
+    scenario.verify(factory.unbet_fee(sp.record(game_id=game1, bettor=alice.address)) == sp.tez(20))
+    scenario.verify(factory.data.games_by_user[alice.address].contains(game1))
+    scenario.verify(factory.get_open_games(alice.address).contains(game1))
+
     # Betting on game 2
 
-    scenario += factory.bet_on_team_b(game2).run(
+    scenario += factory.bet(sp.record(game_id=game2, choice=1)).run(
         sender=mathis.address, amount=sp.tez(7500))
 
-    scenario += factory.bet_on_team_b(game2).run(
+    scenario += factory.bet(sp.record(game_id=game2, choice=1)).run(
         sender=enguerrand.address, amount=sp.tez(500))
 
-    scenario += factory.bet_on_team_b(game2).run(
+    scenario += factory.bet(sp.record(game_id=game2, choice=1)).run(
         sender=alice.address, amount=sp.tez(1000))
 
-    scenario += factory.bet_on_team_b(game2).run(
+    scenario += factory.bet(sp.record(game_id=game2, choice=1)).run(
         sender=bob.address, amount=sp.tez(1000))
 
-    scenario += factory.bet_on_team_a(game2).run(
+    scenario += factory.bet(sp.record(game_id=game2, choice=0)).run(
         sender=gabriel.address, amount=sp.tez(10000))
 
     # Betting on game 3
 
-    scenario += factory.bet_on_team_a(game3).run(
+    scenario += factory.bet(sp.record(game_id=game3, choice=0)).run(
         sender = alice.address, amount=sp.tez(3000), now = sp.timestamp(1546297200))
     
-    scenario += factory.bet_on_team_b(game3).run(
+    scenario += factory.bet(sp.record(game_id=game3, choice=1)).run(
         sender = bob.address, amount = sp.tez(1000), now = sp.timestamp(1546297200))
 
-    scenario += factory.bet_on_team_b(game3).run(
+    scenario += factory.bet(sp.record(game_id=game3, choice=1)).run(
         sender = eloi.address, amount = sp.tez(2000), now = sp.timestamp(1546297200))
 
-    scenario += factory.bet_on_team_a(game3).run(
+    scenario += factory.bet(sp.record(game_id=game3, choice=0)).run(
         sender = gabriel.address, amount = sp.tez(4000), now = sp.timestamp(1546297200))
 
-    scenario += factory.bet_on_team_a(game3).run(
+    scenario += factory.bet(sp.record(game_id=game3, choice=0)).run(
         sender = levillain.address, amount = sp.tez(4000), now = sp.timestamp(1546297200))
 
-    scenario += factory.bet_on_team_a(game3).run(
+    scenario += factory.bet(sp.record(game_id=game3, choice=0)).run(
         sender = pascal.address, amount = sp.tez(4000), now = sp.timestamp(1546297200))
 
-    scenario += factory.bet_on_team_a(game3).run(
+    scenario += factory.bet(sp.record(game_id=game3, choice=0)).run(
         sender = olivier.address, amount = sp.tez(4000), now = sp.timestamp(1546297200))
 
+    # Betting on several games and outcomes at once
+
+    scenario += factory.place_bets(sp.list([
+        sp.record(game_id=game3, choice=0, amount=sp.tez(10)),
+        sp.record(game_id=game3, choice=2, amount=sp.tez(20)),
+        sp.record(game_id=game8, choice=1, amount=sp.tez(30))
+    ])).run(sender = berger.address, amount = sp.tez(60), now = sp.timestamp(1546297200))
+
+    scenario.verify(factory.data.bet_amount_by_user[sp.pair(game3, berger.address)].stakes[2] == sp.tez(20))
+
+    # Testing the amount sent must match the sum of the bets
+    scenario += factory.place_bets(sp.list([
+        sp.record(game_id=game3, choice=0, amount=sp.tez(10)),
+        sp.record(game_id=game8, choice=1, amount=sp.tez(30))
+    ])).run(sender = hennequin.address, amount = sp.tez(50), now = sp.timestamp(1546297200), valid=False)
+
+    # Testing bets of a batch on the same game and outcome go to a single position, which backs the outcome once
+    scenario += factory.place_bets(sp.list([
+        sp.record(game_id=game3, choice=1, amount=sp.tez(10)),
+        sp.record(game_id=game3, choice=1, amount=sp.tez(5))
+    ])).run(sender = hennequin.address, amount = sp.tez(15), now = sp.timestamp(1546297200))
+
+    scenario.verify(factory.data.bet_amount_by_user[sp.pair(game3, hennequin.address)].stakes[1] == sp.tez(15))
+    scenario.verify(factory.data.games[game3].bets_by_choice[1] == 3)
+
     # Betting on game 5
 
-    scenario += factory.bet_on_team_b(game5).run(sender=mathis.address, amount=sp.tez(100), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 0))
+    scenario += factory.bet(sp.record(game_id=game5, choice=1)).run(sender=mathis.address, amount=sp.tez(100), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 0))
 
-    scenario += factory.unbet_on_team_b(game5).run(sender=mathis.address)
+    scenario += factory.unbet(sp.record(game_id=game5, choice=1)).run(sender=mathis.address)
 
-    scenario += factory.bet_on_tie(game5).run(sender=mathis.address, amount=sp.tez(7500))
+    scenario += factory.bet(sp.record(game_id=game5, choice=2)).run(sender=mathis.address, amount=sp.tez(7500))
 
-    scenario += factory.bet_on_team_a(game5).run(sender=enguerrand.address, amount=sp.tez(500))
+    scenario += factory.bet(sp.record(game_id=game5, choice=0)).run(sender=enguerrand.address, amount=sp.tez(500))
 
-    scenario += factory.bet_on_team_b(game5).run(sender=enguerrand.address, amount=sp.tez(2500))
+    scenario += factory.bet(sp.record(game_id=game5, choice=1)).run(sender=enguerrand.address, amount=sp.tez(2500))
 
     # Testing an outcome cannot be set twice
     scenario += factory.set_outcome(sp.record(
@@ -423,7 +1211,7 @@ def test():
 
     scenario.h1("Testing bet removal")
 
-    scenario += factory.unbet_on_tie(game1).run(sender=bob.address)
+    scenario += factory.unbet(sp.record(game_id=game1, choice=2)).run(sender=bob.address)
 
     scenario.h1("Testing outcome")
 
@@ -431,6 +1219,10 @@ def test():
 
     scenario += factory.set_outcome(sp.record(game_id = game2, choice = 1)).run(sender=admin.address, now = sp.timestamp(1640998862))
 
+    scenario.verify(factory.data.games[game2].settlement.to_pay == 4)
+
+    scenario.verify(factory.data.games[game2].settlement.winning_pool == sp.tez(10000))
+
     # Testing the deletion of games with no bet records
     scenario += factory.set_outcome(sp.record(game_id = game6, choice = 1)).run(sender=admin.address, now = sp.timestamp(1640998862))
 
@@ -439,7 +1231,7 @@ def test():
 
     scenario.h1("Testing losers can recover their bet amount when there is no bet on the actual outcome")
 
-    # scenario += factory.bet_on_team_a(game8).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
+    # scenario += factory.bet(sp.record(game_id=game8, choice=0)).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
 
     # scenario += factory.set_outcome(sp.record(game_id = game8, choice = 1)).run(sender=admin.address, now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 3))
 
@@ -447,20 +1239,20 @@ def test():
 
     scenario.h1("Testing players can remove all their bets at once")
 
-    scenario += factory.bet_on_team_a(game8).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
+    scenario += factory.bet(sp.record(game_id=game8, choice=0)).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
 
-    scenario += factory.bet_on_team_b(game8).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
+    scenario += factory.bet(sp.record(game_id=game8, choice=1)).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
 
-    scenario += factory.bet_on_tie(game8).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
+    scenario += factory.bet(sp.record(game_id=game8, choice=2)).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
 
-    scenario += factory.unbet_all(game8).run(sender=enguerrand.address, now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 2))
+    scenario += factory.unbet(sp.record(game_id=game8, choice=-1)).run(sender=enguerrand.address, now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 2))
 
 
     scenario.h1("Testing contract's remainder increase when no-bet games are deleted")
 
-    scenario += factory.bet_on_team_b(game7).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
+    scenario += factory.bet(sp.record(game_id=game7, choice=1)).run(sender=enguerrand.address, amount=sp.tez(2500), now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1))
 
-    scenario += factory.unbet_on_team_b(game7).run(sender=enguerrand.address, now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 20))
+    scenario += factory.unbet(sp.record(game_id=game7, choice=1)).run(sender=enguerrand.address, now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 20))
 
     scenario += factory.set_outcome(sp.record(game_id = game7, choice = 1)).run(sender=admin.address, now=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 59))
 
@@ -481,6 +1273,9 @@ def test():
     # Testing Bob can redeem a winning bet while having lost another one
     scenario += factory.redeem_tez(game2).run(sender=bob.address)
 
+    # Testing the whole batch fails if one of the games cannot be redeemed
+    scenario += factory.redeem_many(sp.list([game5, game1])).run(sender=mathis.address, valid=False)
+
     # Testing Alice cannot redeem gains from a game she did not bet on
     scenario += factory.redeem_tez(game1).run(sender=alice.address, valid=False)
 
@@ -492,6 +1287,206 @@ def test():
 
     scenario += factory.redeem_tez(game5).run(sender=enguerrand.address)
 
+    scenario.verify(~factory.data.games.contains(game5))
+
+    scenario.h1("Testing winnings withdrawal over several games at once")
+
+    game9 = 9
+    scenario += factory.new_game(sp.record(
+        game_id=game9,
+        team_a="Rennes",
+        team_b="Nantes",
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
+    )).run(sender=admin)
+
+    game10 = 10
+    scenario += factory.new_game(sp.record(
+        game_id=game10,
+        team_a="Brest",
+        team_b="Lens",
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
+    )).run(sender=admin)
+
+    scenario += factory.place_bets(sp.list([
+        sp.record(game_id=game9, choice=0, amount=sp.tez(100)),
+        sp.record(game_id=game10, choice=2, amount=sp.tez(200))
+    ])).run(sender = olivier.address, amount = sp.tez(300), now = sp.timestamp(1546297200))
+
+    scenario += factory.bet(sp.record(game_id=game9, choice=1)).run(sender=pascal.address, amount=sp.tez(50), now = sp.timestamp(1546297200))
+
+    scenario += factory.bet(sp.record(game_id=game10, choice=1)).run(sender=pascal.address, amount=sp.tez(50), now = sp.timestamp(1546297200))
+
+    scenario += factory.set_outcome(sp.record(game_id = game9, choice = 0)).run(sender=admin.address, now = sp.timestamp(1640998862))
+
+    # Nobody backed the outcome of game 10, so Olivier is refunded
+    scenario += factory.set_outcome(sp.record(game_id = game10, choice = 0)).run(sender=admin.address, now = sp.timestamp(1640998862))
+
+    scenario += factory.redeem_many(sp.list([game9, game10])).run(sender=olivier.address)
+
+    scenario.verify(~factory.data.games.contains(game9))
+
+    scenario.verify(factory.data.games.contains(game10))
+
+    scenario += factory.redeem_tez(game10).run(sender=pascal.address)
+
+    scenario.verify(~factory.data.games.contains(game10))
+
+    scenario.h1("Testing fixtures and results can be loaded by batches")
+
+    game12 = 12
+    game13 = 13
+    game14 = 14
+    fixtures = sp.list([
+        sp.record(game_id=game12, team_a="Metz", team_b="Reims", match_timestamp=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1), outcomes=3),
+        sp.record(game_id=game13, team_a="Lille", team_b="Monaco", match_timestamp=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1), outcomes=3),
+        sp.record(game_id=game14, team_a="Angers", team_b="Troyes", match_timestamp=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1), outcomes=3)
+    ])
+
+    scenario += factory.new_games(fixtures).run(sender=alice, valid=False)
+
+    scenario += factory.new_games(fixtures).run(sender=admin)
+
+    # Testing a duplicated game id makes the whole batch fail
+    scenario += factory.new_games(sp.list([
+        sp.record(game_id=15, team_a="Caen", team_b="Auxerre", match_timestamp=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1), outcomes=3),
+        sp.record(game_id=game12, team_a="Metz", team_b="Reims", match_timestamp=sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1), outcomes=3)
+    ])).run(sender=admin, valid=False)
+
+    scenario.verify(~factory.data.games.contains(15))
+
+    scenario += factory.bet(sp.record(game_id=game13, choice=1)).run(sender=bob.address, amount=sp.tez(100), now = sp.timestamp(1546297200))
+
+    scenario += factory.bet(sp.record(game_id=game14, choice=2)).run(sender=bob.address, amount=sp.tez(100))
+
+    # Testing the whole batch fails if one of the results is not valid
+    scenario += factory.set_outcomes(sp.list([
+        sp.record(game_id=game12, choice=0),
+        sp.record(game_id=game13, choice=3)
+    ])).run(sender=admin.address, now = sp.timestamp(1640998862), valid=False)
+
+    scenario += factory.set_outcomes(sp.list([
+        sp.record(game_id=game12, choice=0),
+        sp.record(game_id=game13, choice=1),
+        sp.record(game_id=game14, choice=10)
+    ])).run(sender=admin.address, now = sp.timestamp(1640998862))
+
+    scenario.verify(~factory.data.games.contains(game12))
+
+    scenario.verify(factory.data.archived_games[game13].outcome == 1)
+
+    scenario.verify(factory.data.games[game14].settlement.refund)
+
+    scenario.h1("Testing bets held as tickets")
+
+    game16 = 16
+    scenario += factory.new_game(sp.record(
+        game_id=game16,
+        team_a="Strasbourg",
+        team_b="Clermont",
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
+    )).run(sender=admin)
+
+    wallet = BetReceiptWallet(factory.address, alice.address)
+    scenario += wallet
+
+    scenario += wallet.bet(sp.record(game_id=game16, choice=0)).run(sender=alice.address, amount=sp.tez(100), now = sp.timestamp(1546297200))
+
+    scenario += wallet.bet(sp.record(game_id=game16, choice=1)).run(sender=alice.address, amount=sp.tez(50), now = sp.timestamp_from_utc(2022, 1, 1, 0, 1, 1))
+
+    scenario += factory.bet(sp.record(game_id=game16, choice=1)).run(sender=bob.address, amount=sp.tez(150), now = sp.timestamp(1546297200))
+
+    # Only the owner can bet or move receipts through the wallet
+    scenario += wallet.bet(sp.record(game_id=game16, choice=0)).run(sender=bob.address, amount=sp.tez(10), now = sp.timestamp(1546297200), valid=False)
+
+    scenario += wallet.return_receipt(sp.record(receipt_id=0, redeem=False)).run(sender=bob.address, now = sp.timestamp(1546297200), valid=False)
+
+    scenario.verify(factory.data.games[game16].ticket_stake_on[0] == sp.tez(100))
+
+    scenario.verify(~factory.data.bet_amount_by_user.contains(sp.pair(game16, wallet.address)))
+
+    # Returning a ticket early goes through the same service fee as unbet
+    scenario += wallet.return_receipt(sp.record(receipt_id=1, redeem=False)).run(sender=alice.address, now=sp.timestamp_from_utc(2022, 1, 1, 0, 31, 1))
+
+    scenario.verify(factory.data.games[game16].jackpot == sp.mutez(9585000))
+
+    scenario += factory.set_outcome(sp.record(game_id = game16, choice = 0)).run(sender=admin.address, now = sp.timestamp(1640998862))
+
+    scenario += factory.redeem_tez(game16).run(sender=bob.address, valid=False)
+
+    scenario += wallet.return_receipt(sp.record(receipt_id=0, redeem=True)).run(sender=alice.address)
+
+    scenario.verify(~factory.data.games.contains(game16))
+
+    # Refunds and payouts were forwarded to the owner, none are left in the wallet
+    scenario.verify(wallet.balance == sp.tez(0))
+
+    scenario.h1("Testing the operator can pay the winners of a finished game by batches")
+
+    game11 = 11
+    scenario += factory.new_game(sp.record(
+        game_id=game11,
+        team_a="Toulouse",
+        team_b="Bordeaux",
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=3
+    )).run(sender=admin)
+
+    scenario += factory.bet(sp.record(game_id=game11, choice=0)).run(sender=alice.address, amount=sp.tez(100), now = sp.timestamp(1546297200))
+
+    scenario += factory.bet(sp.record(game_id=game11, choice=1)).run(sender=bob.address, amount=sp.tez(100))
+
+    scenario += factory.bet(sp.record(game_id=game11, choice=0)).run(sender=eloi.address, amount=sp.tez(300))
+
+    scenario += factory.bet(sp.record(game_id=game11, choice=2)).run(sender=victor.address, amount=sp.tez(100))
+
+    # Only the admin can settle a game, and only once its outcome is known
+    scenario += factory.settle_batch(sp.record(game_id = game11, max_count = 2)).run(sender=admin.address, valid=False)
+
+    scenario += factory.set_outcome(sp.record(game_id = game11, choice = 0)).run(sender=admin.address, now = sp.timestamp(1640998862))
+
+    scenario += factory.settle_batch(sp.record(game_id = game11, max_count = 2)).run(sender=alice.address, valid=False)
+
+    scenario += factory.settle_batch(sp.record(game_id = game11, max_count = 2)).run(sender=admin.address)
+
+    scenario.verify(~factory.data.bet_amount_by_user.contains(sp.pair(game11, alice.address)))
+
+    scenario.verify(~factory.data.bet_amount_by_user.contains(sp.pair(game11, bob.address)))
+
+    scenario.verify(factory.data.games[game11].settle_cursor == 2)
+
+    scenario += factory.settle_batch(sp.record(game_id = game11, max_count = 2)).run(sender=admin.address)
+
+    scenario.verify(~factory.data.games.contains(game11))
+
+    scenario.h1("Testing markets with more than three outcomes")
+
+    # Total goals market: 0, 1, 2, 3 or more than 3 goals
+    game17 = 17
+    scenario += factory.new_game(sp.record(
+        game_id=game17,
+        team_a="Montpellier",
+        team_b="Ajaccio",
+        match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1),
+        outcomes=5
+    )).run(sender=admin)
+
+    scenario += factory.bet(sp.record(game_id=game17, choice=4)).run(sender=alice.address, amount=sp.tez(100), now = sp.timestamp(1546297200))
+
+    scenario += factory.bet(sp.record(game_id=game17, choice=1)).run(sender=bob.address, amount=sp.tez(300), now = sp.timestamp(1546297200))
+
+    scenario += factory.bet(sp.record(game_id=game17, choice=5)).run(sender=bob.address, amount=sp.tez(300), now = sp.timestamp(1546297200), valid=False)
+
+    scenario += factory.set_outcome(sp.record(game_id = game17, choice = 5)).run(sender=admin.address, now = sp.timestamp(1640998862), valid=False)
+
+    scenario += factory.set_outcome(sp.record(game_id = game17, choice = 4)).run(sender=admin.address, now = sp.timestamp(1640998862))
+
+    scenario += factory.redeem_tez(game17).run(sender=alice.address)
+
+    scenario.verify(~factory.data.games.contains(game17))
+
     scenario.h1("Setting outcome but match has not started")
 
     scenario += factory.set_outcome(sp.record(
@@ -502,4 +1497,435 @@ def test():
     scenario += factory.set_outcome(sp.record(
         game_id=game1,
         choice=2,
-    )).run(sender=admin.address, valid=False)
\ No newline at end of file
+    )).run(sender=admin.address, valid=False)
+
+
+def check_probe_game(open_games):
+    # The bet, unbet and redeem steps on the probe game below must succeed whatever the number of open games.
+    # Nothing here measures cost, the interpreter does not count gas: bench_report.py compares the gas of the
+    # same steps on the bench_probe scenarios of benchmark.py
+    scenario = sp.test_scenario()
+    admin = sp.test_account("Admin")
+    alice = sp.test_account("Alice")
+    bob = sp.test_account("Bob")
+    match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+
+    factory = SoccerBetFactory(admin.address)
+    scenario += factory
+    scenario.h1("Opening %d games" % open_games)
+    for game_id in range(1, open_games + 1):
+        scenario += factory.new_game(sp.record(
+            game_id=game_id,
+            team_a="Team A",
+            team_b="Team B",
+            match_timestamp = match_timestamp,
+            outcomes=3
+        )).run(sender=admin)
+        scenario += factory.bet(sp.record(game_id=game_id, choice=0)).run(sender=bob.address, amount=sp.tez(10))
+
+    scenario.h1("Probing a single game")
+    probe = open_games
+    scenario += factory.bet(sp.record(game_id=probe, choice=1)).run(sender=alice.address, amount=sp.tez(100))
+    scenario += factory.unbet(sp.record(game_id=probe, choice=1)).run(sender=alice.address)
+    scenario += factory.bet(sp.record(game_id=probe, choice=1)).run(sender=alice.address, amount=sp.tez(100))
+    scenario += factory.set_outcome(sp.record(game_id = probe, choice = 1)).run(sender=admin.address, now = sp.timestamp(1640998862))
+    scenario += factory.redeem_tez(probe).run(sender=alice.address)
+    scenario.verify(~factory.data.games.contains(probe))
+
+
+@sp.add_test(name="Probe game next to one open game")
+def test_probe_game_one_game():
+    check_probe_game(1)
+
+
+@sp.add_test(name="Probe game next to many open games")
+def test_probe_game_many_games():
+    check_probe_game(100)
+
+
+@sp.add_test(name="Storage behind the events")
+def test_events():
+    # Scenarios cannot read back emitted events, so this only checks the storage each event describes, step by step.
+    # The layout of the payloads is fixed by EVENT_TYPES, which indexer/tests.py checks against decode_event.
+    scenario = sp.test_scenario()
+    admin = sp.test_account("Admin")
+    alice = sp.test_account("Alice")
+    bob = sp.test_account("Bob")
+    pascal = sp.test_account("Pascal")
+    match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+
+    factory = SoccerBetFactory(admin.address)
+    scenario += factory
+    scenario += factory.new_game(sp.record(
+        game_id=20,
+        team_a="Rennes",
+        team_b="Brest",
+        match_timestamp = match_timestamp,
+        outcomes=3
+    )).run(sender=admin)
+
+    # bet
+    for bettor, choice, amount in [(alice, 0, sp.tez(100)), (bob, 1, sp.tez(50)), (pascal, 1, sp.tez(30))]:
+        scenario += factory.bet(sp.record(game_id=20, choice=choice)).run(sender=bettor.address, amount=amount, now=sp.timestamp_from_utc(2022, 1, 1, 0, 1, 1))
+        scenario.verify(factory.data.bet_amount_by_user[sp.pair(20, bettor.address)].stakes[choice] == amount)
+    scenario.verify(factory.data.games[20].total_bet_amount == sp.tez(180))
+
+    # unbet, with the fee the view announced
+    scenario.verify(factory.unbet_fee(sp.record(game_id=20, bettor=bob.address)) == sp.mutez(9585000))
+    scenario += factory.unbet(sp.record(game_id=20, choice=1)).run(sender=bob.address, now=sp.timestamp_from_utc(2022, 1, 1, 0, 31, 1))
+    scenario.verify(factory.data.games[20].jackpot == sp.mutez(9585000))
+    scenario.verify(factory.data.games[20].total_bet_amount == sp.tez(130))
+    scenario.verify(~factory.data.games_by_user.contains(bob.address))
+
+    # outcome and settlement
+    scenario += factory.set_outcome(sp.record(game_id=20, choice=0)).run(sender=admin.address, now=sp.timestamp_from_utc(2022, 1, 1, 3, 0, 0))
+    scenario.verify(factory.data.games[20].outcome == 0)
+    scenario.verify(~factory.data.games[20].settlement.refund)
+    scenario.verify(factory.data.games[20].settlement.unpaid == sp.mutez(139585000))
+    scenario.verify(factory.data.games[20].settlement.winning_pool == sp.tez(100))
+
+    # redeem, then game_deleted with nothing left to the remainder
+    scenario += factory.redeem_tez(20).run(sender=alice.address)
+    scenario.verify(factory.balance == sp.tez(0))
+    scenario.verify(~factory.data.games.contains(20))
+    scenario.verify(factory.data.remainder == sp.tez(0))
+    scenario.verify(~factory.data.games_by_user.contains(alice.address))
+    # Pascal's losing position is still indexed but the game is gone
+    scenario.verify(factory.data.games_by_user[pascal.address].contains(20))
+    scenario.verify(sp.len(factory.get_open_games(pascal.address)) == 0)
+
+    # outcome of a cancelled game without bets, then game_deleted
+    scenario += factory.new_game(sp.record(
+        game_id=21,
+        team_a="Lens",
+        team_b="Lille",
+        match_timestamp = match_timestamp,
+        outcomes=3
+    )).run(sender=admin)
+    scenario += factory.set_outcome(sp.record(game_id=21, choice=CANCELLED)).run(sender=admin.address)
+    scenario.verify(~factory.data.games.contains(21))
+    scenario.verify(factory.data.remainder == sp.tez(0))
+
+
+@sp.add_test(name="Sweeping expired games")
+def test_sweep():
+    scenario = sp.test_scenario()
+    admin = sp.test_account("Admin")
+    alice = sp.test_account("Alice")
+    bob = sp.test_account("Bob")
+    pascal = sp.test_account("Pascal")
+    match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+    result_time = sp.timestamp_from_utc(2022, 1, 1, 3, 0, 0)
+
+    factory = SoccerBetFactory(admin.address)
+    scenario += factory
+    scenario += factory.new_games(sp.list([
+        sp.record(game_id=30, team_a="Metz", team_b="Nancy", match_timestamp=match_timestamp, outcomes=3),
+        sp.record(game_id=31, team_a="Dijon", team_b="Troyes", match_timestamp=match_timestamp, outcomes=3)
+    ])).run(sender=admin)
+
+    scenario += factory.bet(sp.record(game_id=30, choice=0)).run(sender=alice.address, amount=sp.tez(100))
+    scenario += factory.bet(sp.record(game_id=30, choice=1)).run(sender=bob.address, amount=sp.tez(50))
+    scenario += factory.bet(sp.record(game_id=30, choice=0)).run(sender=pascal.address, amount=sp.tez(20))
+    scenario += factory.bet(sp.record(game_id=31, choice=0)).run(sender=alice.address, amount=sp.tez(10))
+
+    # Testing no bet can be placed on a game once it has been cancelled
+    scenario += factory.new_game(sp.record(game_id=32, team_a="Sedan", team_b="Reims", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin)
+    scenario += factory.bet(sp.record(game_id=32, choice=0)).run(sender=bob.address, amount=sp.tez(10))
+    scenario += factory.set_outcome(sp.record(game_id=32, choice=CANCELLED)).run(sender=admin.address)
+    scenario += factory.bet(sp.record(game_id=32, choice=1)).run(sender=bob.address, amount=sp.tez(10), valid=False)
+    scenario += factory.unbet(sp.record(game_id=32, choice=0)).run(sender=bob.address, valid=False)
+    scenario += factory.redeem_tez(32).run(sender=bob.address)
+
+    scenario += factory.set_outcomes(sp.list([
+        sp.record(game_id=30, choice=0),
+        sp.record(game_id=31, choice=0)
+    ])).run(sender=admin.address, now=result_time)
+    scenario += factory.redeem_tez(30).run(sender=alice.address)
+    scenario += factory.redeem_tez(31).run(sender=alice.address)
+    scenario.verify(~factory.data.games.contains(31))
+
+    # Testing an id cannot be reused before its game has been swept
+    scenario += factory.new_game(sp.record(game_id=31, team_a="Dijon", team_b="Troyes", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin, valid=False)
+
+    # Nothing is swept before the claim deadline
+    scenario += factory.sweep(10).run(now=sp.timestamp_from_utc(2022, 6, 1, 0, 0, 0))
+    scenario.verify(factory.data.sweep_head == 1)
+    scenario.verify(factory.data.archived_games.contains(30))
+
+    # Alice's slot (already redeemed) and Bob's losing position
+    scenario += factory.sweep(2).run(now=sp.timestamp_from_utc(2022, 7, 1, 0, 0, 0))
+    scenario.verify(factory.data.sweep_cursor == 2)
+    scenario.verify(~factory.data.games_by_user.contains(bob.address))
+    scenario.verify(factory.data.games.contains(30))
+
+    # Pascal never redeemed 20 * 170 / 120 tez, which is reclaimed with the rounding leftovers of Alice's payout
+    scenario += factory.sweep(10).run(now=sp.timestamp_from_utc(2022, 7, 1, 0, 0, 0))
+    scenario.verify(factory.data.remainder == sp.mutez(28333334))
+    scenario.verify(factory.data.sweep_head == 3)
+    scenario.verify(factory.data.sweep_cursor == 0)
+    scenario.verify(~factory.data.games.contains(30))
+    scenario.verify(~factory.data.archived_games.contains(30))
+    scenario.verify(~factory.data.archived_games.contains(31))
+    scenario.verify(~factory.data.bet_amount_by_user.contains(sp.pair(30, pascal.address)))
+    scenario.verify(~factory.data.games_by_user.contains(pascal.address))
+    scenario.verify(~factory.data.games_by_user.contains(alice.address))
+
+    scenario += factory.new_game(sp.record(game_id=31, team_a="Dijon", team_b="Troyes", match_timestamp=sp.timestamp_from_utc(2022, 8, 1, 1, 1, 1), outcomes=3)).run(sender=admin)
+
+    # Testing a game left without bets hands the slots of its former bettors to sweep, even behind a game whose
+    # claim deadline is months away
+    kickoff = sp.timestamp_from_utc(2022, 8, 1, 1, 1, 1)
+    result_time = sp.timestamp_from_utc(2022, 8, 1, 3, 0, 0)
+    scenario += factory.new_games(sp.list([
+        sp.record(game_id=33, team_a="Caen", team_b="Le Havre", match_timestamp=kickoff, outcomes=3),
+        sp.record(game_id=34, team_a="Lorient", team_b="Vannes", match_timestamp=kickoff, outcomes=3)
+    ])).run(sender=admin)
+    scenario += factory.bet(sp.record(game_id=34, choice=0)).run(sender=alice.address, amount=sp.tez(10), now=sp.timestamp_from_utc(2022, 7, 1, 0, 0, 0))
+    scenario += factory.set_outcome(sp.record(game_id=34, choice=0)).run(sender=admin.address, now=result_time)
+    for bettor in [bob, pascal]:
+        scenario += factory.bet(sp.record(game_id=33, choice=0)).run(sender=bettor.address, amount=sp.tez(10), now=sp.timestamp_from_utc(2022, 7, 1, 0, 0, 0))
+        scenario += factory.unbet(sp.record(game_id=33, choice=0)).run(sender=bettor.address, now=sp.timestamp_from_utc(2022, 7, 1, 0, 0, 0))
+    scenario += factory.set_outcome(sp.record(game_id=33, choice=1)).run(sender=admin.address, now=result_time)
+    scenario.verify(~factory.data.games.contains(33))
+    scenario.verify(~factory.data.archived_games.contains(33))
+    scenario.verify(factory.data.emptied_games[33] == 2)
+    scenario.verify(factory.data.sweep_queue[factory.data.sweep_head] == 34)
+
+    # The id is only free again once the slots are cleared
+    scenario += factory.new_game(sp.record(game_id=33, team_a="Caen", team_b="Le Havre", match_timestamp=sp.timestamp_from_utc(2022, 8, 8, 1, 1, 1), outcomes=3)).run(sender=admin, valid=False)
+    scenario += factory.sweep(1).run(now=result_time)
+    scenario.verify(factory.data.emptied_games[33] == 1)
+    scenario += factory.sweep(10).run(now=result_time)
+    scenario.verify(~factory.data.bettor_index.contains(sp.pair(33, 0)))
+    scenario.verify(~factory.data.bettor_index.contains(sp.pair(33, 1)))
+    scenario.verify(~factory.data.emptied_games.contains(33))
+    scenario.verify(factory.data.emptied_head == factory.data.emptied_tail)
+    # Game 34 is still waiting for its claim deadline
+    scenario.verify(factory.data.archived_games.contains(34))
+    scenario.verify(factory.data.sweep_queue[factory.data.sweep_head] == 34)
+    scenario += factory.new_game(sp.record(game_id=33, team_a="Caen", team_b="Le Havre", match_timestamp=sp.timestamp_from_utc(2022, 8, 8, 1, 1, 1), outcomes=3)).run(sender=admin)
+
+
+@sp.add_test(name="Per-game markets")
+def test_markets():
+    scenario = sp.test_scenario()
+    admin = sp.test_account("Admin")
+    alice = sp.test_account("Alice")
+    bob = sp.test_account("Bob")
+    pascal = sp.test_account("Pascal")
+    match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+    result_time = sp.timestamp_from_utc(2022, 1, 1, 3, 0, 0)
+
+    factory = SoccerBetFactory(admin.address)
+    scenario += factory
+
+    scenario.h1("Originating a market per game")
+    scenario += factory.new_market(sp.record(game_id=40, team_a="Nantes", team_b="Angers", match_timestamp=match_timestamp, outcomes=3)).run(sender=alice, valid=False)
+    scenario += factory.new_market(sp.record(game_id=40, team_a="Nantes", team_b="Angers", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin)
+    scenario += factory.new_market(sp.record(game_id=41, team_a="Lorient", team_b="Brest", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin)
+    market40 = scenario.dynamic_contract(0, factory.market)
+    market41 = scenario.dynamic_contract(1, factory.market)
+    scenario.verify(factory.data.markets[40] == market40.address)
+    scenario.verify(factory.data.markets[41] == market41.address)
+    scenario.verify(market40.data.factory == factory.address)
+
+    # Testing a game id cannot be held by a market and by the factory at once
+    scenario += factory.new_game(sp.record(game_id=40, team_a="Nantes", team_b="Angers", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin, valid=False)
+    scenario += factory.new_market(sp.record(game_id=41, team_a="Lorient", team_b="Brest", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin, valid=False)
+
+    scenario.h1("Betting on a market")
+    scenario += market40.call("bet", 0).run(sender=alice.address, amount=sp.tez(100))
+    scenario += market40.call("bet", 1).run(sender=bob.address, amount=sp.tez(50))
+    scenario += market40.call("bet", 0).run(sender=pascal.address, amount=sp.tez(20))
+    scenario += market40.call("bet", 3).run(sender=pascal.address, amount=sp.tez(20), valid=False)
+    scenario.verify(market40.data.game.total_bet_amount == sp.tez(170))
+    scenario.verify(market40.data.bet_amount_by_user[alice.address].stakes[0] == sp.tez(100))
+    scenario.verify(~factory.data.games.contains(40))
+
+    # Bob's only bet on game 41 is removed an hour before kickoff, leaving a 9.585 tez jackpot and no bettor
+    scenario += market41.call("bet", 1).run(sender=bob.address, amount=sp.tez(50), now=sp.timestamp_from_utc(2022, 1, 1, 0, 1, 1))
+    scenario += market41.call("unbet", 1).run(sender=bob.address, now=sp.timestamp_from_utc(2022, 1, 1, 0, 31, 1))
+    scenario.verify(market41.data.game.jackpot == sp.mutez(9585000))
+
+    scenario.h1("Settling through the factory")
+    # Testing only the factory can set the outcome of a market
+    scenario += market40.call("set_outcome", 0).run(sender=admin.address, now=result_time, valid=False)
+    scenario += factory.set_outcomes(sp.list([
+        sp.record(game_id=40, choice=0),
+        sp.record(game_id=41, choice=0)
+    ])).run(sender=admin.address, now=result_time)
+    scenario.verify(market40.data.game.settlement.winning_pool == sp.tez(120))
+
+    # The empty market hands its jackpot back right away
+    scenario.verify(market41.data.closed)
+    scenario.verify(~factory.data.markets.contains(41))
+    scenario.verify(factory.data.remainder == sp.mutez(9585000))
+
+    scenario.h1("Collecting the remainder of every market")
+    scenario += market40.call("redeem_tez", sp.unit).run(sender=bob.address, valid=False)
+    scenario += market40.call("redeem_tez", sp.unit).run(sender=alice.address)
+    scenario += market40.call("settle_batch", 3).run(sender=alice.address, valid=False)
+    # Bob's losing position is pruned and Pascal is paid 20 * 170 / 120 tez, which closes the market
+    scenario += market40.call("settle_batch", 3).run(sender=admin.address)
+    scenario.verify(market40.data.closed)
+    scenario.verify(~market40.data.bet_amount_by_user.contains(bob.address))
+    scenario.verify(market40.balance == sp.tez(0))
+    scenario.verify(~factory.data.markets.contains(40))
+    # One mutez of rounding left by the payouts of game 40
+    scenario.verify(factory.data.remainder == sp.mutez(9585001))
+    scenario.verify(factory.balance == sp.mutez(9585001))
+
+    # Testing only a registered market can hand a remainder back
+    scenario += factory.collect_remainder(40).run(sender=alice.address, amount=sp.tez(1), valid=False)
+
+
+# Chain the permit tests run on
+PERMIT_CHAIN = sp.chain_id_cst("0x9caecab9")
+
+
+def sign_permit(factory, account, intent, chain_id=PERMIT_CHAIN):
+    intent = sp.set_type_expr(intent, INTENT_TYPE)
+    return sp.record(
+        key=account.public_key,
+        signature=sp.make_signature(account.secret_key, sp.pack(sp.pair(chain_id, sp.pair(factory.address, intent))), message_format="Raw"),
+        intent=intent)
+
+
+@sp.add_test(name="Relayed bets with signed permits")
+def test_permits():
+    scenario = sp.test_scenario()
+    admin = sp.test_account("Admin")
+    alice = sp.test_account("Alice")
+    bob = sp.test_account("Bob")
+    operator = sp.test_account("Operator")
+    match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+    expiry = sp.timestamp_from_utc(2022, 1, 1, 1, 0, 0)
+    now = sp.timestamp_from_utc(2022, 1, 1, 0, 59, 0)
+
+    factory = SoccerBetFactory(admin.address)
+    scenario += factory
+    scenario += factory.new_game(sp.record(game_id=50, team_a="Nice", team_b="Toulouse", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin)
+
+    scenario.h1("Prepaid balances")
+    scenario += factory.deposit().run(sender=alice.address, amount=sp.tez(200))
+    scenario += factory.deposit().run(sender=bob.address, amount=sp.tez(50))
+    scenario += factory.withdraw(sp.tez(60)).run(sender=bob.address, valid=False)
+
+    scenario.h1("Relaying a batch of signed bets")
+    batch = sp.list([
+        sign_permit(factory, alice, sp.record(game_id=50, choice=0, amount=sp.tez(100), nonce=sp.nat(0), expiry=expiry)),
+        sign_permit(factory, bob, sp.record(game_id=50, choice=1, amount=sp.tez(50), nonce=sp.nat(0), expiry=expiry)),
+        sign_permit(factory, alice, sp.record(game_id=50, choice=2, amount=sp.tez(50), nonce=sp.nat(1), expiry=expiry))
+    ])
+    scenario += factory.relay_bets(batch).run(sender=operator.address, chain_id=PERMIT_CHAIN, amount=sp.tez(1), now=now, valid=False)
+    scenario += factory.relay_bets(batch).run(sender=operator.address, chain_id=PERMIT_CHAIN, now=now)
+    scenario.verify(factory.data.bet_amount_by_user[sp.pair(50, alice.address)].stakes[0] == sp.tez(100))
+    scenario.verify(factory.data.bet_amount_by_user[sp.pair(50, alice.address)].stakes[2] == sp.tez(50))
+    scenario.verify(factory.data.bet_amount_by_user[sp.pair(50, bob.address)].stakes[1] == sp.tez(50))
+    scenario.verify(~factory.data.bet_amount_by_user.contains(sp.pair(50, operator.address)))
+    scenario.verify(factory.data.games[50].total_bet_amount == sp.tez(200))
+    scenario.verify(factory.data.balances[alice.address] == sp.tez(50))
+    scenario.verify(~factory.data.balances.contains(bob.address))
+    scenario.verify(factory.data.nonces[alice.address] == 2)
+
+    # Testing a batch cannot be replayed
+    scenario += factory.relay_bets(batch).run(sender=operator.address, chain_id=PERMIT_CHAIN, now=now, valid=False)
+
+    # Testing an intent signed with another key, an expired intent and an intent above the balance are rejected
+    forged = sign_permit(factory, bob, sp.record(game_id=50, choice=1, amount=sp.tez(10), nonce=sp.nat(2), expiry=expiry))
+    scenario += factory.relay_bets(sp.list([sp.record(key=alice.public_key, signature=forged.signature, intent=forged.intent)])).run(
+        sender=operator.address, chain_id=PERMIT_CHAIN, now=now, valid=False)
+    scenario += factory.relay_bets(sp.list([
+        sign_permit(factory, alice, sp.record(game_id=50, choice=1, amount=sp.tez(10), nonce=sp.nat(2), expiry=expiry))
+    ])).run(sender=operator.address, chain_id=PERMIT_CHAIN, now=sp.timestamp_from_utc(2022, 1, 1, 1, 0, 1), valid=False)
+    scenario += factory.relay_bets(sp.list([
+        sign_permit(factory, alice, sp.record(game_id=50, choice=1, amount=sp.tez(60), nonce=sp.nat(2), expiry=expiry))
+    ])).run(sender=operator.address, chain_id=PERMIT_CHAIN, now=now, valid=False)
+
+    # Testing an intent signed for another chain is rejected
+    scenario += factory.relay_bets(sp.list([
+        sign_permit(factory, alice, sp.record(game_id=50, choice=1, amount=sp.tez(10), nonce=sp.nat(2), expiry=expiry),
+                    chain_id=sp.chain_id_cst("0x7a06a770"))
+    ])).run(sender=operator.address, chain_id=PERMIT_CHAIN, now=now, valid=False)
+
+    # Testing a failing intent reverts the whole batch
+    scenario += factory.relay_bets(sp.list([
+        sign_permit(factory, alice, sp.record(game_id=50, choice=1, amount=sp.tez(10), nonce=sp.nat(2), expiry=expiry)),
+        sign_permit(factory, bob, sp.record(game_id=50, choice=1, amount=sp.tez(10), nonce=sp.nat(1), expiry=expiry))
+    ])).run(sender=operator.address, chain_id=PERMIT_CHAIN, now=now, valid=False)
+    scenario.verify(factory.data.nonces[alice.address] == 2)
+
+    scenario.h1("Withdrawing what was not bet")
+    scenario += factory.withdraw(sp.tez(50)).run(sender=alice.address)
+    scenario.verify(~factory.data.balances.contains(alice.address))
+    scenario.verify(factory.balance == sp.tez(200))
+
+    # Relayed positions are settled like any other
+    scenario += factory.set_outcome(sp.record(game_id=50, choice=0)).run(sender=admin.address, now=sp.timestamp_from_utc(2022, 1, 1, 3, 0, 0))
+    scenario += factory.redeem_tez(50).run(sender=alice.address)
+    scenario.verify(~factory.data.games.contains(50))
+    scenario.verify(factory.balance == sp.tez(0))
+
+
+@sp.add_test(name="Results pushed by an oracle")
+def test_oracle():
+    # The interpreter does not account for gas: bench_report.py measures receive_results per resolved
+    # game on the oracle scenarios of benchmark.py
+    scenario = sp.test_scenario()
+    admin = sp.test_account("Admin")
+    operator = sp.test_account("Operator")
+    alice = sp.test_account("Alice")
+    bob = sp.test_account("Bob")
+    match_timestamp = sp.timestamp_from_utc(2022, 1, 1, 1, 1, 1)
+    result_time = sp.timestamp_from_utc(2022, 1, 1, 3, 0, 0)
+    game_ids = range(100, 200)
+
+    factory = SoccerBetFactory(admin.address)
+    scenario += factory
+    oracle = MockOracle(operator.address, factory.address)
+    scenario += oracle
+
+    scenario.h1("Loading a hundred fixtures")
+    scenario += factory.new_games(sp.list([
+        sp.record(game_id=game_id, team_a="Team A", team_b="Team B", match_timestamp=match_timestamp, outcomes=3) for game_id in game_ids
+    ])).run(sender=admin)
+    scenario += factory.new_market(sp.record(game_id=300, team_a="Caen", team_b="Laval", match_timestamp=match_timestamp, outcomes=3)).run(sender=admin)
+    market = scenario.dynamic_contract(0, factory.market)
+
+    # Alice backs the home team on every even game and Bob the away team on one game out of four, odd games stay empty
+    for game_id in game_ids:
+        if game_id % 2 == 0:
+            scenario += factory.bet(sp.record(game_id=game_id, choice=0)).run(sender=alice.address, amount=sp.tez(10))
+        if game_id % 4 == 0:
+            scenario += factory.bet(sp.record(game_id=game_id, choice=1)).run(sender=bob.address, amount=sp.tez(5))
+    scenario += market.call("bet", 0).run(sender=alice.address, amount=sp.tez(10))
+
+    matchday = sp.list([sp.record(game_id=game_id, choice=0) for game_id in game_ids] + [sp.record(game_id=300, choice=0)])
+
+    scenario.h1("Authorising the oracle")
+    # Testing the oracle cannot push results before the admin authorises it
+    scenario += oracle.publish(matchday).run(sender=operator.address, now=result_time, valid=False)
+    scenario += factory.set_oracle(oracle.address).run(sender=alice.address, valid=False)
+    scenario += factory.set_oracle(oracle.address).run(sender=admin.address)
+    scenario += factory.receive_results(matchday).run(sender=admin.address, now=result_time, valid=False)
+    scenario += oracle.publish(matchday).run(sender=alice.address, now=result_time, valid=False)
+
+    scenario.h1("Resolving a whole matchday in one callback")
+    # Testing the whole batch fails if one of the results is not valid
+    scenario += oracle.publish(sp.list([sp.record(game_id=100, choice=0), sp.record(game_id=101, choice=3)])).run(
+        sender=operator.address, now=result_time, valid=False)
+    scenario += oracle.publish(matchday).run(sender=operator.address, now=result_time)
+    scenario.verify(oracle.data.published == 101)
+    scenario.verify(factory.data.archived_games[100].outcome == 0)
+    scenario.verify(factory.data.games[100].settlement.to_pay == 1)
+    scenario.verify(factory.data.games[102].settlement.winning_pool == sp.tez(10))
+    scenario.verify(~factory.data.games.contains(101))
+    scenario.verify(~factory.data.archived_games.contains(101))
+    scenario.verify(market.data.game.outcome == 0)
+
+    # Testing results cannot be pushed twice
+    scenario += oracle.publish(sp.list([sp.record(game_id=100, choice=1)])).run(sender=operator.address, now=result_time, valid=False)
+
+    scenario += factory.redeem_many(sp.list([100, 102])).run(sender=alice.address)
+    scenario.verify(~factory.data.games.contains(100))
@@ -0,0 +1,325 @@
+"""Integer reference model of the SoccerBetFactory economics, vectorised with NumPy.
+
+A Market holds a batch of independent games sharing the same number of bettor slots.
+Every operation is applied to the whole batch at once, one bettor per game, and returns
+the mask of the games on which the contract would have accepted it. Amounts are integer
+mutez and every rounding follows the contract: the service fee of remove_bet and the
+split_tokens payouts of redeem round down.
+
+Ticket mode, batches and the sweeper are not modelled: they move the same funds through
+the same settlement as the entry points below.
+
+    python reference_model.py --games 100000 --bettors 16 --steps 64 --runs 5
+
+differential.py replays sampled sequences through both this model and the contract.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+CANCELLED = 10
+MAX_OUTCOMES = CANCELLED
+ONE_DAY = 86000  # as in service_fee
+START = 1640995200  # 2022-01-01T00:00:00Z
+HORIZON = 3 * 86400
+
+
+class InvariantError(AssertionError):
+    pass
+
+
+def service_fee(time_diff, amount):
+    """Fee charged on amount when the position was opened time_diff seconds before kickoff."""
+    hours = time_diff // 3600
+    return np.where(time_diff < ONE_DAY, (2000 - 83 * hours) * amount // 10000, 0)
+
+
+def split_tokens(amount, numerator, denominator):
+    # The products overflow 64 bits for large pools, so they are computed on Python integers
+    return (amount.astype(object) * numerator.astype(object) // denominator.astype(object)).astype(np.int64)
+
+
+class Market:
+    def __init__(self, match_time, outcomes, bettors):
+        self.match_time = np.asarray(match_time, dtype=np.int64)
+        self.outcomes = np.asarray(outcomes, dtype=np.int64)
+        games = len(self.match_time)
+        self.rows = np.arange(games)
+        zeros = lambda: np.zeros(games, dtype=np.int64)
+
+        self.exists = np.ones(games, dtype=bool)
+        self.outcome = np.full(games, -1, dtype=np.int64)
+        self.stakes = np.zeros((games, bettors, MAX_OUTCOMES), dtype=np.int64)
+        self.position_time = np.zeros((games, bettors), dtype=np.int64)
+        self.pool = np.zeros((games, MAX_OUTCOMES), dtype=np.int64)
+        self.total = zeros()
+        self.jackpot = zeros()
+        self.bettors = zeros()
+
+        self.refund = np.zeros(games, dtype=bool)
+        self.numerator = zeros()
+        self.denominator = np.ones(games, dtype=np.int64)
+        self.unpaid = zeros()
+        self.to_pay = zeros()
+        self.remainder = zeros()
+
+        # Bookkeeping used by the invariants only
+        self.deposits = zeros()
+        self.withdrawals = zeros()
+        self.winners_paid = zeros()
+        self.swept_jackpot = zeros()
+
+    @property
+    def games(self):
+        return len(self.rows)
+
+    def _batch(self, *values):
+        return [np.broadcast_to(np.asarray(value, dtype=np.int64), (self.games,)) for value in values]
+
+    def _active(self, active):
+        return np.ones(self.games, dtype=bool) if active is None else np.asarray(active, dtype=bool)
+
+    def bet(self, bettor, choice, amount, now, active=None):
+        bettor, choice, amount, now = self._batch(bettor, choice, amount, now)
+        ok = (self._active(active) & self.exists & (now < self.match_time) & (self.outcome == -1)
+              & (amount > 0) & (choice >= 0) & (choice < self.outcomes))
+        g, b, c, a = self.rows[ok], bettor[ok], choice[ok], amount[ok]
+        new = self.stakes[g, b].sum(axis=1) == 0
+        self.position_time[g[new], b[new]] = now[ok][new]
+        self.bettors[g[new]] += 1
+        self.stakes[g, b, c] += a
+        self.pool[g, c] += a
+        self.total[g] += a
+        self.deposits[g] += a
+        return ok
+
+    def unbet(self, bettor, choice, now, active=None):
+        bettor, choice, now = self._batch(bettor, choice, now)
+        position = self.stakes[self.rows, bettor]
+        held = position.sum(axis=1)
+        whole = choice == -1
+        index = np.clip(choice, 0, MAX_OUTCOMES - 1)
+        on_choice = np.where((choice >= 0) & (choice < MAX_OUTCOMES), position[self.rows, index], 0)
+        ok = (self._active(active) & self.exists & (held > 0) & (now < self.match_time)
+              & (self.outcome == -1) & (whole | (on_choice > 0)))
+
+        taken = np.where(whole[:, None], position, 0)
+        taken[self.rows, index] = np.where(whole, position[self.rows, index], on_choice)
+        taken[~ok] = 0
+        removed = taken.sum(axis=1)
+        fee = np.where(ok, service_fee(self.match_time - self.position_time[self.rows, bettor], removed), 0)
+
+        self.stakes[self.rows, bettor] = position - taken
+        self.pool -= taken
+        self.total -= removed
+        self.jackpot += fee
+        self.withdrawals += removed - fee
+        self.bettors -= (ok & (removed == held)).astype(np.int64)
+        return ok
+
+    def set_outcome(self, choice, now, active=None):
+        choice, now = self._batch(choice, now)
+        possible = ((choice >= 0) & (choice < self.outcomes) & (now > self.match_time)) | (choice == CANCELLED)
+        ok = self._active(active) & self.exists & (self.outcome == -1) & possible
+        self.outcome = np.where(ok, choice, self.outcome)
+
+        # Games without any bet are deleted straight away, their jackpot going to the remainder
+        empty = ok & (self.total == 0)
+        swept = np.where(empty, self.jackpot, 0)
+        self.remainder += swept
+        self.swept_jackpot += swept
+        self.jackpot -= swept
+        self.exists &= ~empty
+
+        settle = ok & ~empty
+        index = np.clip(choice, 0, MAX_OUTCOMES - 1)
+        backed = choice < MAX_OUTCOMES
+        winning_pool = np.where(backed, self.pool[self.rows, index], 0)
+        winners = np.where(backed, (self.stakes[self.rows, :, index] > 0).sum(axis=1), 0)
+        refund = winning_pool == 0
+        pot = self.total + self.jackpot
+        self.refund = np.where(settle, refund, self.refund)
+        self.numerator = np.where(settle, pot, self.numerator)
+        self.denominator = np.where(settle, np.where(refund, self.total, winning_pool), self.denominator)
+        self.unpaid = np.where(settle, pot, self.unpaid)
+        self.to_pay = np.where(settle, np.where(refund, self.bettors, winners), self.to_pay)
+        return ok
+
+    def redeem(self, bettor, active=None):
+        (bettor,) = self._batch(bettor)
+        position = self.stakes[self.rows, bettor]
+        held = position.sum(axis=1)
+        index = np.clip(self.outcome, 0, MAX_OUTCOMES - 1)
+        backed = (self.outcome >= 0) & (self.outcome < MAX_OUTCOMES)
+        stake = np.where(self.refund, held, np.where(backed, position[self.rows, index], 0))
+        ok = self._active(active) & self.exists & (held > 0) & (self.outcome != -1) & (stake > 0)
+
+        payout = np.zeros(self.games, dtype=np.int64)
+        payout[ok] = split_tokens(stake[ok], self.numerator[ok], self.denominator[ok])
+        paid = ok.astype(np.int64)
+        self.unpaid -= payout
+        self.to_pay -= paid
+        self.withdrawals += payout
+        self.winners_paid += paid
+        self.stakes[self.rows[ok], bettor[ok]] = 0
+        self.bettors -= paid
+
+        # The last winner deletes the game, rounding leftovers going to the remainder
+        done = ok & (self.to_pay == 0)
+        self.remainder += np.where(done, self.unpaid, 0)
+        self.unpaid = np.where(done, 0, self.unpaid)
+        self.exists &= ~done
+        return ok
+
+    def check_invariants(self):
+        balance = self.deposits - self.withdrawals
+        running = self.exists & (self.outcome == -1)
+        settled = self.exists & (self.outcome != -1)
+        _check("non negative jackpot", self.jackpot >= 0)
+        _check("non negative unpaid winnings", self.unpaid >= 0)
+        _check("non negative stakes", (self.stakes >= 0).all(axis=(1, 2)))
+        _check("conservation of funds before the outcome", ~running | (balance == self.total + self.jackpot))
+        _check("pools matching the positions", ~running | (self.pool == self.stakes.sum(axis=1)).all(axis=1))
+        _check("total matching the pools", ~running | (self.total == self.pool.sum(axis=1)))
+        _check("conservation of funds after the outcome", ~settled | (balance == self.unpaid))
+        _check("winners left to pay", ~settled | (self.to_pay > 0))
+        _check("deleted games leaving their funds to the remainder", self.exists | (balance == self.remainder))
+        # Each payout rounds down by less than a mutez, so n payouts leave at most n - 1 mutez behind
+        _check("rounding leftovers", self.remainder - self.swept_jackpot <= np.maximum(self.winners_paid - 1, 0))
+
+    def check_drained(self):
+        """Once every game has an outcome and every winner redeemed, only the remainder is left."""
+        _check("all games deleted", ~self.exists)
+        _check("full drainage", self.deposits - self.withdrawals == self.remainder)
+
+    def storage(self):
+        """Plain Python view of what the contract stores, as compared by differential.py."""
+        games = {}
+        for g in np.flatnonzero(self.exists):
+            outcomes = int(self.outcomes[g])
+            game = dict(
+                outcome=int(self.outcome[g]),
+                total_bet_amount=int(self.total[g]),
+                jackpot=int(self.jackpot[g]),
+                bettors=int(self.bettors[g]),
+                bet_amount_on=[int(amount) for amount in self.pool[g, :outcomes]],
+                settlement=None)
+            if self.outcome[g] != -1:
+                game["settlement"] = dict(refund=bool(self.refund[g]), unpaid=int(self.unpaid[g]), to_pay=int(self.to_pay[g]))
+            games[int(g)] = game
+        held = self.stakes.sum(axis=2) > 0
+        positions = {(int(g), int(b)): [int(amount) for amount in self.stakes[g, b, :self.outcomes[g]]] for g, b in zip(*np.nonzero(held))}
+        return dict(
+            games=games,
+            positions=positions,
+            remainder=int(self.remainder.sum()),
+            balance=int((self.deposits - self.withdrawals).sum()))
+
+
+def _check(name, holds):
+    holds = np.asarray(holds)
+    if not holds.all():
+        raise InvariantError("%s broken for games %s" % (name, np.flatnonzero(~holds)[:10].tolist()))
+
+
+def random_market(rng, games, bettors):
+    match_time = START + rng.integers(86400, 2 * 86400, games)
+    outcomes = rng.integers(2, 5, games)
+    return Market(match_time, outcomes, bettors)
+
+
+def simulate(games, bettors, steps, seed, record=False, check=True):
+    """Runs a random sequence on a batch of games, then gives every game an outcome and pays every winner.
+
+    Returns the market and, when record is set, the list of operations in the order they were applied
+    with whether the contract should accept them. A "checkpoint" entry holding the storage of the model
+    separates the sampled sequence from the final draining.
+    """
+    rng = np.random.default_rng(seed)
+    market = random_market(rng, games, bettors)
+    trace = [] if record else None
+    step_seconds = HORIZON // steps
+
+    def log(kind, active, ok, now, bettor=None, choice=None, amount=None):
+        if trace is None:
+            return
+        for g in np.flatnonzero(active):
+            trace.append(dict(
+                kind=kind,
+                game_id=int(g),
+                bettor=None if bettor is None else int(bettor[g]),
+                choice=None if choice is None else int(choice[g]),
+                amount=None if amount is None else int(amount[g]),
+                now=int(now),
+                ok=bool(ok[g])))
+
+    for step in range(steps):
+        now = START + step * step_seconds
+        bettor = rng.integers(0, bettors, games)
+        draw = rng.random(games)
+        before = now < market.match_time
+        # Mostly bets and unbets before kickoff with a few early cancellations, outcomes and redemptions after it
+        bets = before & (draw < 0.7)
+        unbets = before & (draw >= 0.7) & (draw < 0.995)
+        outcomes = (before & (draw >= 0.995)) | (~before & (market.outcome == -1))
+        redeems = ~before & ~outcomes
+
+        choice = rng.integers(0, market.outcomes)
+        amount = rng.integers(1, 10 ** 9, games)
+        ok = market.bet(bettor, choice, amount, now, bets)
+        log("bet", bets, ok, now, bettor, choice, amount)
+
+        choice = rng.integers(-1, 4, games)
+        ok = market.unbet(bettor, choice, now, unbets)
+        log("unbet", unbets, ok, now, bettor, choice)
+
+        choice = np.where(before | (rng.random(games) < 0.05), CANCELLED, rng.integers(0, market.outcomes))
+        ok = market.set_outcome(choice, now, outcomes)
+        log("set_outcome", outcomes, ok, now, choice=choice)
+
+        ok = market.redeem(bettor, redeems)
+        log("redeem", redeems, ok, now, bettor)
+
+        if check:
+            market.check_invariants()
+
+    if trace is not None:
+        trace.append(dict(kind="checkpoint", storage=market.storage()))
+
+    now = START + HORIZON + 1
+    pending = market.exists & (market.outcome == -1)
+    choice = rng.integers(0, market.outcomes)
+    ok = market.set_outcome(choice, now, pending)
+    log("set_outcome", pending, ok, now, choice=choice)
+    for slot in range(bettors):
+        bettor = np.full(games, slot)
+        winners = market.exists & (market.stakes[market.rows, slot].sum(axis=1) > 0)
+        ok = market.redeem(bettor, winners)
+        log("redeem", winners & ok, ok, now, bettor)
+    if check:
+        market.check_invariants()
+        market.check_drained()
+    return market, trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzes the reference model and checks its invariants")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--bettors", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for run in range(args.runs):
+        started = time.perf_counter()
+        simulate(args.games, args.bettors, args.steps, args.seed + run)
+        elapsed = time.perf_counter() - started
+        operations = args.games * (args.steps + 1 + args.bettors)
+        print("run %d: %d operations in %.2fs (%.0f operations/s), invariants hold" % (run, operations, elapsed, operations / elapsed))
+
+
+if __name__ == "__main__":
+    main()